@@ -1,40 +1,252 @@
 # bot.py - BLZ-T Bot completo con Slash Commands, Panel de Logs y todas las APIs necesarias
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
 import sqlite3
+import shutil
 import threading
+import queue
+import contextlib
+import atexit
+import heapq
+from collections import OrderedDict
+import bisect
+import math
+from concurrent.futures import ThreadPoolExecutor
 import os
 import asyncio
 import json as json_mod
+import gzip
+import zlib
 import aiohttp
 import time as time_gs
-import urllib.request as urllib_req
-import urllib.parse as urllib_parse
-from flask import Flask, render_template, jsonify, request
+import random
+from aiohttp import web
 from dotenv import load_dotenv
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import re as re_mod
+import html as html_mod
 import datetime
 
 load_dotenv()
 
 # --- CONFIGURACIÓN DE LOGGING ---
+# Quien loguea (loop de discord.py, hilos de BD) sólo encola el registro; un hilo aparte
+# (QueueListener) lo escribe en bot.log, consola y, opcionalmente, JSON lines. Si el disco
+# no da abasto la cola llena descarta y cuenta, nunca bloquea.
 log_file = os.path.join(os.path.dirname(__file__), 'bot.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=3),
-        logging.StreamHandler()
-    ]
-)
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_JSON_PATH = os.getenv("LOG_JSON_PATH")  # p.ej. bot.jsonl; vacío = desactivado
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        return json_mod.dumps({
+            "ts": self.formatTime(record),
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler que no bloquea: con la cola llena el registro se descarta y se cuenta."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = {}
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped[record.levelname] = self.dropped.get(record.levelname, 0) + 1
+
+
+class _LogListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Al parar sí se espera: el hilo está vaciando la cola y no debe perderse el final
+        self.queue.put(self._sentinel)
+
+    def add_handler(self, handler):
+        self.handlers = self.handlers + (handler,)
+
+
+_log_formatter = logging.Formatter(LOG_FORMAT)
+_log_sinks = [RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=3), logging.StreamHandler()]
+if LOG_JSON_PATH:
+    _log_sinks.append(RotatingFileHandler(LOG_JSON_PATH, maxBytes=5*1024*1024, backupCount=3, encoding='utf-8'))
+    _log_sinks[-1].setFormatter(JsonLinesFormatter())
+for _sink in _log_sinks[:2]:
+    _sink.setFormatter(_log_formatter)
+
+log_queue = queue.Queue(maxsize=LOG_QUEUE_MAX)
+log_queue_handler = DroppingQueueHandler(log_queue)
+log_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # el formato final lo pone cada sink
+logging.basicConfig(level=logging.INFO, handlers=[log_queue_handler])
+log_listener = _LogListener(log_queue, *_log_sinks)
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger('blz-bot')
 
-# --- CONFIGURACIÓN FLASK ---
-app = Flask(__name__)
-app.secret_key = os.urandom(24)
+# --- MÉTRICAS (formato de texto de Prometheus, sin dependencias) ---
+# Observar es un dict lookup, un bisect y tres sumas; sólo se llama desde el loop, así que
+# no hay locks. Lo que ya se cuenta en otros `stats` se lee al hacer scrape (callbacks).
+METRIC_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _metric_escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _metric_labels(names, values, extra=""):
+    pairs = [f'{n}="{_metric_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _metric_value(v):
+    if isinstance(v, float) and not math.isfinite(v):
+        return "NaN" if math.isnan(v) else ("+Inf" if v > 0 else "-Inf")
+    return repr(v) if isinstance(v, float) else str(int(v))
+
+
+class _Histogram:
+    def __init__(self, name, help_, labels=(), buckets=METRIC_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_, tuple(labels), tuple(buckets)
+        self._series = {}  # valores de labels -> [cuentas por bucket (no acumuladas), suma, total]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, *label_values):
+        t0 = time_gs.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time_gs.perf_counter() - t0, *label_values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, n) in list(self._series.items()):
+            cumulative = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le_label = 'le="' + ("+Inf" if le == float("inf") else repr(float(le))) + '"'
+                lines.append(f"{self.name}_bucket{_metric_labels(self.labels, label_values, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_metric_labels(self.labels, label_values)} {_metric_value(total)}")
+            lines.append(f"{self.name}_count{_metric_labels(self.labels, label_values)} {n}")
+        return lines
+
+
+class _Counter:
+    def __init__(self, name, help_, labels=()):
+        self.name, self.help, self.labels = name, help_, tuple(labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, v in list(self._values.items()):
+            lines.append(f"{self.name}{_metric_labels(self.labels, label_values)} {_metric_value(v)}")
+        return lines
+
+
+class _Callback:
+    """Valor leído al hacer scrape: `fn()` devuelve un número o {valores de labels: número}."""
+
+    def __init__(self, name, help_, kind, fn, labels=()):
+        self.name, self.help, self.kind, self.fn, self.labels = name, help_, kind, fn, tuple(labels)
+
+    def render(self):
+        try:
+            values = self.fn()
+        except Exception as e:
+            logger.error(f"!!! [METRICS] {self.name}: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, v in values.items():
+            if v is None:
+                continue
+            lines.append(f"{self.name}{_metric_labels(self.labels, label_values)} {_metric_value(v)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name, help_, labels=()):
+        metric = _Histogram(name, help_, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_, labels=()):
+        metric = _Counter(name, help_, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def callback(self, name, help_, kind, fn, labels=()):
+        self._metrics.append(_Callback(name, help_, kind, fn, labels))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+METRIC_ON_MESSAGE = metrics.histogram("blz_on_message_seconds", "Duración del handler on_message")
+METRIC_SAVE_MESSAGE = metrics.histogram("blz_save_message_seconds", "save_message_to_db, incluida la espera por backpressure")
+METRIC_HTTP = metrics.histogram("blz_http_request_seconds", "Peticiones al dashboard por ruta", ("method", "route"))
+METRIC_HTTP_RESPONSES = metrics.counter("blz_http_responses_total", "Respuestas del dashboard por ruta y estado", ("method", "route", "status"))
+METRIC_BOT_HOP = metrics.histogram("blz_bot_hop_seconds", "Operaciones de Discord esperadas desde rutas web (_await_bot)")
+METRIC_BOT_HOP_TIMEOUTS = metrics.counter("blz_bot_hop_timeouts_total", "Operaciones de Discord que superaron el timeout de la ruta")
+METRIC_DISCORD_REST = metrics.histogram("blz_discord_rest_seconds", "Llamadas REST a Discord por ruta (incluye esperas de rate limit)", ("route",))
+METRIC_DISCORD_REST_RESPONSES = metrics.counter("blz_discord_rest_responses_total", "Llamadas REST a Discord por ruta y estado", ("route", "status"))
+METRIC_SHEETS = metrics.histogram("blz_sheets_request_seconds", "Llamadas a la API de Google Sheets (con reintentos)", ("op",))
+METRIC_THPING_FIRE = metrics.histogram("blz_thping_fire_seconds", "Iteraciones del scheduler de thping por resultado", ("result",))
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    t0 = time_gs.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        # La plantilla de la ruta (/api/tickets/{channel_id}/...), no la URL: cardinalidad acotada
+        resource = getattr(request.match_info.route, "resource", None)
+        route = resource.canonical if resource is not None else "unmatched"
+        METRIC_HTTP.observe(time_gs.perf_counter() - t0, request.method, route)
+        METRIC_HTTP_RESPONSES.inc(request.method, route, str(status))
+
+# --- CONFIGURACIÓN WEB (aiohttp, corre dentro de client.loop) ---
+app = web.Application(middlewares=[metrics_middleware])
+routes = web.RouteTableDef()
+web_runner = None
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("PORT", "5000"))
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
 
 TOKEN = os.getenv("DISCORD_TOKEN")
 
@@ -57,6 +269,8 @@ THPING_ROLES = {
     "asia": [1355062394547736674, 1408493161319501904],
 }
 THPING_INTERVAL_SECONDS = 24 * 60 * 60  # 24 horas
+THPING_RETRY_SECONDS = 5 * 60  # si el envío falla, se reintenta a los 5 min
+THPING_SEND_TIMEOUT = 30
 THPING_ALLOWED_ROLES = [1355062394547736675, 1355062394547736673, 1483349943962964068]
 
 def col_letter(n):
@@ -66,10 +280,9 @@ def col_letter(n):
         s = chr(65 + r) + s
     return s
 
-def _gs_get_token():
+def _gs_refresh_token():
+    """Pide un access token nuevo a Google (bloqueante: correr en un hilo)."""
     now = int(time_gs.time())
-    if _gs_token_cache["token"] and now < _gs_token_cache["exp"] - 60:
-        return _gs_token_cache["token"]
     if not SHEETS_CREDS_JSON:
         raise RuntimeError("GOOGLE_SHEETS_CREDENTIALS no está configurado")
     try:
@@ -94,221 +307,1581 @@ def _gs_get_token():
     _gs_token_cache["exp"] = now + 3000
     return token
 
-def _gs_get(range_):
-    enc = urllib_parse.quote(range_, safe="!")
-    _url = f"https://sheets.googleapis.com/v4/spreadsheets/{SHEET_ID}/values/{enc}"
-    req = urllib_req.Request(_url, headers={"Authorization": f"Bearer {_gs_get_token()}"})
-    with urllib_req.urlopen(req, timeout=10) as r:
-        return json_mod.loads(r.read()).get("values", [])
-
-def _gs_put(range_, values):
-    enc = urllib_parse.quote(range_, safe="!")
-    _url = f"https://sheets.googleapis.com/v4/spreadsheets/{SHEET_ID}/values/{enc}?valueInputOption=USER_ENTERED"
-    body = json_mod.dumps({"range": range_, "majorDimension": "ROWS", "values": values}).encode()
-    req = urllib_req.Request(_url, data=body, method="PUT", headers={
-        "Authorization": f"Bearer {_gs_get_token()}",
-        "Content-Type": "application/json"
-    })
-    with urllib_req.urlopen(req, timeout=10) as r:
-        return json_mod.loads(r.read())
+def _gs_get_token():
+    now = int(time_gs.time())
+    if _gs_token_cache["token"] and now < _gs_token_cache["exp"] - 60:
+        return _gs_token_cache["token"]
+    return _gs_refresh_token()
+
+# --- SHEETS: transporte aiohttp (keep-alive, reintentos, token renovado en segundo plano) ---
+SHEETS_API_BASE = os.getenv("SHEETS_API_BASE", "https://sheets.googleapis.com/v4")
+SHEETS_TIMEOUT = 10
+SHEETS_MAX_RETRIES = 4
+SHEETS_BACKOFF_BASE = 0.5
+SHEETS_BACKOFF_CAP = 8.0
+SHEETS_TOKEN_REFRESH_MARGIN = 300  # renovar 5 min antes de _gs_token_cache["exp"]
+
+
+class SheetsTransport:
+    """Cliente HTTP de la API de Sheets sobre una sesión aiohttp reutilizada.
+
+    Reintenta 429/5xx y errores de red con backoff exponencial + jitter (respetando
+    Retry-After), y renueva el token desde una tarea de fondo antes de que caduque para
+    que ninguna petición pague el refresh. `base_url` y `token_provider` permiten apuntarlo
+    a un servidor falso local (ver scripts/fake_sheets_server.py).
+    """
+
+    def __init__(self, base_url=SHEETS_API_BASE, sheet_id=SHEET_ID, token_provider=None):
+        self.base_url = base_url.rstrip("/")
+        self.sheet_id = sheet_id
+        self._token_provider = token_provider
+        self._session = None
+        self._refresh_task = None
+        self._refresh_lock = None
+        self.stats = {"requests": 0, "retries": 0, "errors": 0, "token_refreshes": 0}
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=SHEETS_TIMEOUT)
+            )
+        return self._session
+
+    @staticmethod
+    def _cached_token():
+        if _gs_token_cache["token"] and int(time_gs.time()) < _gs_token_cache["exp"] - 60:
+            return _gs_token_cache["token"]
+        return None
+
+    async def _refresh_token(self, force=False):
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            # Quien esperaba el lock usa el token que acaba de pedir el anterior
+            token = None if force else self._cached_token()
+            if token:
+                return token
+            token = await asyncio.to_thread(_gs_refresh_token)
+            self.stats["token_refreshes"] += 1
+            return token
+
+    async def _token(self):
+        if self._token_provider is not None:
+            return self._token_provider()
+        token = self._cached_token()
+        if token:
+            return token
+        # Sólo ocurre si el refresco de fondo no llegó a tiempo (o aún no arrancó)
+        return await self._refresh_token()
+
+    async def _token_refresher(self):
+        while True:
+            wait = _gs_token_cache["exp"] - SHEETS_TOKEN_REFRESH_MARGIN - time_gs.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await self._refresh_token(force=True)
+            except Exception as e:
+                logger.error(f"[SHEETS] Refresh de token falló: {e}")
+                await asyncio.sleep(60)
+
+    def start(self):
+        if self._token_provider is None and SHEETS_CREDS_JSON and self._refresh_task is None:
+            self._refresh_task = asyncio.get_running_loop().create_task(self._token_refresher())
+
+    async def close(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(SHEETS_BACKOFF_CAP, SHEETS_BACKOFF_BASE * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def request(self, method, path, params=None, body=None):
+        url = f"{self.base_url}/spreadsheets/{self.sheet_id}/{path}"
+        reauthed = False
+        attempt = 0
+        while True:
+            self.stats["requests"] += 1
+            headers = {"Authorization": f"Bearer {await self._token()}"}
+            try:
+                async with self._get_session().request(method, url, params=params, json=body, headers=headers) as resp:
+                    if resp.status == 401 and not reauthed and self._token_provider is None:
+                        reauthed = True
+                        _gs_token_cache["token"] = None
+                        continue
+                    if (resp.status == 429 or resp.status >= 500) and attempt < SHEETS_MAX_RETRIES:
+                        delay = self._backoff(attempt, resp.headers.get("Retry-After"))
+                    elif resp.status >= 400:
+                        self.stats["errors"] += 1
+                        raise RuntimeError(f"Sheets HTTP {resp.status}: {(await resp.text())[:200]}")
+                    else:
+                        try:
+                            return await resp.json()
+                        except aiohttp.ContentTypeError:
+                            # 200 con HTML (proxy, página de login...): reintentar no lo arregla
+                            self.stats["errors"] += 1
+                            raise RuntimeError(f"Sheets respuesta no JSON ({resp.content_type}): "
+                                               f"{(await resp.text())[:200]}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= SHEETS_MAX_RETRIES:
+                    self.stats["errors"] += 1
+                    raise RuntimeError(f"Sheets {type(e).__name__}: {e}")
+                delay = self._backoff(attempt)
+            attempt += 1
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    async def batch_get(self, ranges):
+        params = [("ranges", r) for r in ranges] + [("majorDimension", "ROWS")]
+        with METRIC_SHEETS.time("batchGet"):
+            data = await self.request("GET", "values:batchGet", params=params)
+        return [vr.get("values", []) for vr in data.get("valueRanges", [])]
+
+    async def batch_update(self, data):
+        with METRIC_SHEETS.time("batchUpdate"):
+            return await self.request("POST", "values:batchUpdate", body={
+                "valueInputOption": "USER_ENTERED",
+                "data": [{"range": range_, "majorDimension": "ROWS", "values": values} for range_, values in data]
+            })
+
+
+sheets_transport = SheetsTransport()
+
+def _detect_region(member):
+    role_ids = [r.id for r in getattr(member, "roles", [])]
+    for role_id, label, cu, ce, cq in REGION_ROLES:
+        if role_id in role_ids:
+            return label, cu, ce, cq
+    return None, None, None, None
+
+def _ep_value(cell):
+    try:
+        return int(cell)
+    except (ValueError, TypeError):
+        return 0
+
+# --- SHEETS: índice de filas por región + escrituras agrupadas ---
+SHEETS_INDEX_TTL = int(os.getenv("SHEETS_INDEX_TTL", "60"))  # segundos antes de releer una región
+
+
+class SheetsEPTracker:
+    """Índice username -> fila (y EP actual) por región de la pestaña Tracker.
+
+    Un lote de EP se escribe con un único values:batchUpdate. Antes se releen en un
+    values:batchGet las celdas de las filas afectadas, y la región entera cuando su índice
+    caducó o aparece un jugador que no tenemos indexado, para no pisar ediciones manuales.
+    """
+
+    def __init__(self):
+        self._index = {}    # región -> {"rows": {username_lower: fila}, "ep": {fila: ep}, "next_row": n, "loaded": ts}
+        self._lock = asyncio.Lock()
+
+    async def _load(self, regions):
+        ranges = [
+            f"'{SHEET_TAB}'!{col_letter(cu)}{SHEET_DATA_START_ROW}:{col_letter(ce)}"
+            for cu, ce, _ in regions.values()
+        ]
+        now = time_gs.time()
+        for (label, (cu, ce, _)), rows in zip(regions.items(), await sheets_transport.batch_get(ranges)):
+            ep_offset = ce - cu
+            by_name, ep, last_row = {}, {}, SHEET_DATA_START_ROW - 1
+            for i, row in enumerate(rows):
+                name = str(row[0]).strip() if row else ""
+                if not name:
+                    continue
+                row_num = SHEET_DATA_START_ROW + i
+                last_row = row_num
+                by_name.setdefault(name.lower(), row_num)
+                ep[row_num] = _ep_value(row[ep_offset]) if len(row) > ep_offset else 0
+            self._index[label] = {"rows": by_name, "ep": ep, "next_row": last_row + 1, "loaded": now}
+
+    async def _refresh_rows(self, keys):
+        """Relee usuario+EP de las filas ya indexadas de `keys` ({(región, username_lower): cols}).
+
+        El índice puede tener hasta SHEETS_INDEX_TTL s: sin esto, un EP editado a mano en ese
+        intervalo se pisaría con `actual + incremento`. Si la fila ya no tiene ese usuario
+        (filas movidas o borradas a mano), se relee la región entera.
+        """
+        touched = []
+        for key, cols in keys.items():
+            row = self._index[key[0]]["rows"].get(key[1])
+            if row:
+                touched.append((key, cols, row))
+        if not touched:
+            return
+        ranges = [f"'{SHEET_TAB}'!{col_letter(cu)}{row}:{col_letter(ce)}{row}" for _, (cu, ce, _), row in touched]
+        moved = {}
+        for (key, (cu, ce, cq), row), values in zip(touched, await sheets_transport.batch_get(ranges)):
+            cells = values[0] if values else []
+            if not cells or str(cells[0]).strip().lower() != key[1]:
+                moved[key[0]] = (cu, ce, cq)
+                continue
+            self._index[key[0]]["ep"][row] = _ep_value(cells[ce - cu]) if len(cells) > ce - cu else 0
+        if moved:
+            await self._load(moved)
+
+    async def current_ep(self, keys):
+        """EP actual en la hoja de `keys` ({(región, username_lower): cols}); None si no está."""
+        async with self._lock:
+            now = time_gs.time()
+            stale = {}
+            for (label, uname), cols in keys.items():
+                idx = self._index.get(label)
+                if idx is None or now - idx["loaded"] > SHEETS_INDEX_TTL or uname not in idx["rows"]:
+                    stale[label] = cols
+            if stale:
+                await self._load(stale)
+            await self._refresh_rows({key: cols for key, cols in keys.items() if key[0] not in stale})
+            result = {}
+            for label, uname in keys:
+                idx = self._index[label]
+                row = idx["rows"].get(uname)
+                result[(label, uname)] = idx["ep"].get(row, 0) if row else None
+            return result
+
+    async def apply(self, awards, before_write=None):
+        """awards: {(región, username_lower): (username, (col_u, col_ep, col_qw), incremento)}.
+
+        `before_write(plan)` recibe {clave: EP final} y se espera antes del batchUpdate.
+        Devuelve {clave: (ok, mensaje)}.
+        """
+        async with self._lock:
+            now = time_gs.time()
+            stale = {}
+            for (label, uname), (_, cols, _) in awards.items():
+                idx = self._index.get(label)
+                if idx is None or now - idx["loaded"] > SHEETS_INDEX_TTL or uname not in idx["rows"]:
+                    stale[label] = cols
+            try:
+                if stale:
+                    await self._load(stale)
+                # Las regiones recién leídas ya están al día; el resto se relee fila a fila
+                await self._refresh_rows({key: cols for key, (_, cols, _) in awards.items() if key[0] not in stale})
+                updates, applied, results, plan = [], [], {}, {}
+                for key, (username, (cu, ce, cq), inc) in awards.items():
+                    label, uname = key
+                    idx = self._index[label]
+                    row = idx["rows"].get(uname)
+                    if row:
+                        current = idx["ep"].get(row, 0)
+                        new_val = current + inc
+                        updates.append((f"'{SHEET_TAB}'!{col_letter(ce)}{row}", [[str(new_val)]]))
+                        results[key] = (True, f"EP updated! Total: {new_val}")
+                        logger.info(f"[SHEETS] {username} ({label}) fila {row}: EP {current} -> {new_val}")
+                    else:
+                        row = idx["next_row"]
+                        idx["next_row"] += 1
+                        new_val = inc
+                        updates.append((f"'{SHEET_TAB}'!{col_letter(cu)}{row}", [[username]]))
+                        updates.append((f"'{SHEET_TAB}'!{col_letter(ce)}{row}", [[str(new_val)]]))
+                        updates.append((f"'{SHEET_TAB}'!{col_letter(cq)}{row}", [["0"]]))
+                        results[key] = (True, f"Added to tracker! EP: {new_val}")
+                        logger.info(f"[SHEETS] Nuevo {username} ({label}) fila {row}: EP={new_val}")
+                    applied.append((idx, uname, row, new_val))
+                    plan[key] = new_val
+                if before_write is not None:
+                    await before_write(plan)
+                await sheets_transport.batch_update(updates)
+            except Exception:
+                # El índice pudo quedar a medias (next_row reservado): forzar relectura
+                for label, _ in awards:
+                    self._index.pop(label, None)
+                raise
+            for idx, uname, row, new_val in applied:
+                idx["rows"][uname] = row
+                idx["ep"][row] = new_val
+            return results
+
+
+sheets_tracker = SheetsEPTracker()
+
+# --- EP LEDGER: write-behind en SQLite, conciliado con Sheets en segundo plano ---
+EP_RECONCILE_INTERVAL = int(os.getenv("EP_RECONCILE_INTERVAL", "15"))
+EP_RECONCILE_BATCH = 50  # jugadores por batchUpdate
+_REGION_COLS = {label: (cu, ce, cq) for _, label, cu, ce, cq in REGION_ROLES}
+
+def _ep_ledger_insert(region, username, delta):
+    with db_pool.connection() as conn:
+        conn.execute(
+            "INSERT INTO ep_ledger (region, username, delta, created_at) VALUES (?, ?, ?, ?)",
+            (region, username, delta, int(time_gs.time()))
+        )
+
+def _ep_ledger_pending():
+    with db_pool.connection() as conn:
+        return conn.execute(
+            "SELECT region, MIN(username) AS username, LOWER(username) AS uname, "
+            "SUM(delta) AS delta, MAX(id) AS max_id "
+            "FROM ep_ledger WHERE synced_at IS NULL GROUP BY region, LOWER(username) ORDER BY MIN(id)"
+        ).fetchall()
+
+def _ep_ledger_mark_synced(entries):
+    """Marca como volcadas las filas de `entries` [(región, uname, max_id)] y cierra su
+    ep_inflight en la misma transacción."""
+    now = int(time_gs.time())
+    with db_pool.connection() as conn:
+        conn.executemany(
+            "UPDATE ep_ledger SET synced_at=? "
+            "WHERE synced_at IS NULL AND region=? AND LOWER(username)=? AND id<=?",
+            [(now, region, uname, max_id) for region, uname, max_id in entries]
+        )
+        conn.executemany("DELETE FROM ep_inflight WHERE region=? AND uname=?",
+                         [(region, uname) for region, uname, _ in entries])
+
+def _ep_inflight_set(entries):
+    with db_pool.connection() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO ep_inflight (region, uname, max_id, expected) VALUES (?, ?, ?, ?)", entries
+        )
+
+def _ep_inflight_rows():
+    with db_pool.connection() as conn:
+        return conn.execute("SELECT region, uname, max_id, expected FROM ep_inflight").fetchall()
+
+def _ep_inflight_resolve(landed, keys):
+    """`landed` llegaron a la hoja (se marcan volcados); el resto de `keys` no, y sus filas
+    del ledger siguen pendientes para la siguiente pasada."""
+    _ep_ledger_mark_synced(landed)
+    with db_pool.connection() as conn:
+        conn.executemany("DELETE FROM ep_inflight WHERE region=? AND uname=?", keys)
+
+
+class EPReconciler:
+    """Vuelca a la pestaña Tracker el neto pendiente de ep_ledger por (región, username).
+
+    Los premios de EP sólo esperan al INSERT local; si Sheets no responde, las filas
+    siguen pendientes y se reintentan en la siguiente pasada.
+
+    La hoja guarda valores absolutos, así que reenviar un delta ya escrito lo duplicaría.
+    Antes de cada batchUpdate se apunta en ep_inflight el EP final esperado; si el proceso
+    cae (o falla la BD) antes de marcar el ledger, la siguiente pasada compara la hoja con
+    ese valor y sólo reaplica lo que de verdad no llegó.
+    """
+
+    def __init__(self):
+        self._task = None
+        self._wake = None
+        self.stats = {"synced_entries": 0, "flushes": 0, "failures": 0, "last_sync": None, "last_error": None}
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=EP_RECONCILE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def _recover(self):
+        inflight = await run_db(_ep_inflight_rows)
+        if not inflight:
+            return
+        keys = {(row["region"], row["uname"]): _REGION_COLS[row["region"]]
+                for row in inflight if row["region"] in _REGION_COLS}
+        current = await sheets_tracker.current_ep(keys) if keys else {}
+        landed = [(row["region"], row["uname"], row["max_id"]) for row in inflight
+                  if current.get((row["region"], row["uname"])) == row["expected"]]
+        await message_ingestor.run(_ep_inflight_resolve, landed, [(row["region"], row["uname"]) for row in inflight])
+        logger.info(f"[SHEETS] Envíos sin confirmar: {len(landed)} llegaron, {len(inflight) - len(landed)} se reintentan")
+
+    async def flush(self):
+        try:
+            # Lo pendiente de una pasada interrumpida se resuelve antes de mandar nada nuevo
+            await self._recover()
+            pending = await run_db(_ep_ledger_pending)
+        except Exception as e:
+            self.stats["failures"] += 1
+            self.stats["last_error"] = f"{type(e).__name__}: {e}"
+            logger.error(f"[SHEETS] Ledger ilegible: {e}")
+            return
+        unknown = {row["region"] for row in pending if row["region"] not in _REGION_COLS}
+        if unknown:
+            # Sin columnas en la hoja no se pueden volcar nunca: se marcan para no releerlas
+            logger.error(f"[SHEETS] Regiones sin columnas en la hoja, se descartan: {sorted(unknown)}")
+        for i in range(0, len(pending), EP_RECONCILE_BATCH):
+            chunk = pending[i:i + EP_RECONCILE_BATCH]
+            awards = {
+                (row["region"], row["uname"]): (row["username"], _REGION_COLS[row["region"]], row["delta"])
+                for row in chunk if row["delta"] and row["region"] in _REGION_COLS
+            }
+            max_ids = {(row["region"], row["uname"]): row["max_id"] for row in chunk}
+
+            async def mark_inflight(plan):
+                await message_ingestor.run(
+                    _ep_inflight_set, [(region, uname, max_ids[(region, uname)], ep) for (region, uname), ep in plan.items()]
+                )
+
+            try:
+                if awards:
+                    await sheets_tracker.apply(awards, before_write=mark_inflight)
+                await message_ingestor.run(
+                    _ep_ledger_mark_synced, [(row["region"], row["uname"], row["max_id"]) for row in chunk]
+                )
+            except Exception as e:
+                self.stats["failures"] += 1
+                self.stats["last_error"] = f"{type(e).__name__}: {e}"
+                logger.error(f"[SHEETS] Conciliación fallida ({len(awards)} jugadores pendientes): {e}")
+                return
+            self.stats["flushes"] += 1
+            self.stats["synced_entries"] += len(chunk)
+            self.stats["last_sync"] = int(time_gs.time())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Último intento; lo que no entre queda en el ledger para el próximo arranque
+        try:
+            await asyncio.wait_for(self.flush(), timeout=SHEETS_TIMEOUT)
+        except Exception as e:
+            logger.error(f"[SHEETS] Flush final del ledger: {e}")
+
+
+ep_reconciler = EPReconciler()
+
+async def record_ep(username, region, delta=1):
+    """Apunta EP en el ledger local; la hoja se actualiza en la siguiente conciliación."""
+    await message_ingestor.run(_ep_ledger_insert, region, username, delta)
+    logger.info(f"[SHEETS] EP {delta:+d} para {username} ({region}) en ledger")
+    return True, "EP recorded! The tracker will update shortly."
+
+async def _member_with_roles(member):
+    # Sin caché de miembros puede llegar un User (o un Member sin roles): se pide al guild
+    if getattr(member, "roles", None):
+        return member
+    guild = getattr(member, "guild", None)
+    if guild is None:
+        return member
+    try:
+        return guild.get_member(member.id) or await guild.fetch_member(member.id)
+    except discord.HTTPException as e:
+        logger.error(f"[SHEETS] No se pudo obtener el miembro {member.id}: {e}")
+        return member
+
+async def award_ep(member, username):
+    """+1 EP en la región del miembro."""
+    region, _, _, _ = _detect_region(await _member_with_roles(member))
+    if not region:
+        return False, "No region role"
+    return await record_ep(username, region)
+
+raw_id = os.getenv("CATEGORY_ID")
+if not raw_id:
+    logger.warning("Variable CATEGORY_ID no encontrada. Usando 0.")
+    TARGET_CATEGORY_ID = 0
+else:
+    try:
+        TARGET_CATEGORY_ID = int(raw_id)
+    except ValueError:
+        TARGET_CATEGORY_ID = 0
+        logger.error("CATEGORY_ID no es numérico")
+
+# --- SETUP DISCORD BOT ---
+intents = discord.Intents.default()
+intents.message_content = True
+intents.members = True
+intents.guilds = True
+intents.guild_messages = True
+intents.reactions = True
+
+# Modo de poca memoria: sin caché de miembros ni chunking al arrancar, caché de mensajes
+# mínima. Los miembros se piden bajo demanda (query_members / fetch) donde hacen falta.
+LOW_MEMORY_MODE = os.getenv("LOW_MEMORY_MODE", "0").lower() in ("1", "true", "yes")
+MEMBER_CACHE = os.getenv("MEMBER_CACHE", "none" if LOW_MEMORY_MODE else "all").lower()  # all | joined | voice | none
+CHUNK_GUILDS_AT_STARTUP = os.getenv("CHUNK_GUILDS_AT_STARTUP", "0" if LOW_MEMORY_MODE else "1").lower() in ("1", "true", "yes")
+MAX_MESSAGES = int(os.getenv("MAX_MESSAGES", "0" if LOW_MEMORY_MODE else "1000")) or None
+
+def _member_cache_flags(spec):
+    if spec == "all":
+        return discord.MemberCacheFlags.all()
+    if spec == "none":
+        return discord.MemberCacheFlags.none()
+    flags = discord.MemberCacheFlags.none()
+    for name in filter(None, (n.strip() for n in spec.split(","))):
+        if name not in discord.MemberCacheFlags.VALID_FLAGS:
+            logger.error(f"!!! [MEMBER CACHE] Flag desconocido en MEMBER_CACHE: {name!r} "
+                         f"(válidos: all, none, {', '.join(discord.MemberCacheFlags.VALID_FLAGS)})")
+            continue
+        setattr(flags, name, True)
+    return flags
+
+# Sólo con caché completa y chunking guild.members está entero y sirve de índice
+MEMBERS_CACHED = MEMBER_CACHE == "all" and CHUNK_GUILDS_AT_STARTUP
+
+class BLZBot(commands.Bot):
+    async def setup_hook(self):
+        message_ingestor.start()
+        sheets_transport.start()
+        ep_reconciler.start()
+        await start_web_server()
+
+    async def close(self):
+        try:
+            await stop_web_server()
+        except Exception as e:
+            logger.error(f"!!! [WEB STOP]: {e}")
+        try:
+            await thping_scheduler.stop()
+            await deadline_scheduler.stop()
+            await ticket_archiver.stop()
+        except Exception as e:
+            logger.error(f"!!! [DEADLINE STOP]: {e}")
+        try:
+            await ep_reconciler.stop()
+            await sheets_transport.close()
+        except Exception as e:
+            logger.error(f"!!! [SHEETS CLOSE]: {e}")
+        # Garantiza que los mensajes encolados llegan a disco antes de desconectar
+        try:
+            await message_ingestor.stop()
+        except Exception as e:
+            logger.error(f"!!! [INGEST STOP]: {e}")
+        await super().close()
+
+# Prefix mantenido por compatibilidad de librerías, pero los comandos funcionales son Slash
+client = BLZBot(
+    command_prefix="!",
+    intents=intents,
+    member_cache_flags=_member_cache_flags(MEMBER_CACHE),
+    chunk_guilds_at_startup=CHUNK_GUILDS_AT_STARTUP,
+    max_messages=MAX_MESSAGES
+)
+bot_ready_event = threading.Event()
+
+def _instrument_discord_http(http):
+    """Envuelve HTTPClient.request para medir cada llamada REST por plantilla de ruta."""
+    original = http.request
+
+    async def request(route, **kwargs):
+        label = f"{route.method} {route.path}"
+        t0 = time_gs.perf_counter()
+        status = "error"
+        try:
+            result = await original(route, **kwargs)
+            status = "ok"
+            return result
+        except discord.HTTPException as e:
+            status = str(e.status)
+            raise
+        finally:
+            METRIC_DISCORD_REST.observe(time_gs.perf_counter() - t0, label)
+            METRIC_DISCORD_REST_RESPONSES.inc(label, status)
+
+    http.request = request
+
+_instrument_discord_http(client.http)
+
+# --- RESOLVER DE ENTIDADES DE DISCORD (canales, usuarios, roles, mensajes) ---
+RESOLVER_MAX_ENTRIES = int(os.getenv("RESOLVER_MAX_ENTRIES", "4096"))
+RESOLVER_TTL = {"channel": 600, "user": 600, "role": 300, "message": 120}
+RESOLVER_NEGATIVE_TTL = 60
+_NOT_FOUND = object()
+
+
+class DiscordResolver:
+    """get_* de discord.py primero; si no está, LRU+TTL propia y, al final, REST.
+
+    Los NotFound se recuerdan RESOLVER_NEGATIVE_TTL segundos (devuelven None), y varias
+    peticiones simultáneas del mismo id esperan a un único fetch. Otros errores HTTP
+    (Forbidden, 5xx) se propagan y no se cachean.
+    """
+
+    def __init__(self, max_entries=RESOLVER_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # (tipo, id) -> (caduca, valor | _NOT_FOUND)
+        self._inflight = {}
+        self.stats = {"local_hits": 0, "hits": 0, "negative_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def forget(self, kind, item_id):
+        self._cache.pop((kind, int(item_id)), None)
+
+    def _store(self, key, value, ttl):
+        self._cache[key] = (time_gs.monotonic() + ttl, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def _resolve(self, kind, item_id, local, remote):
+        key = (kind, int(item_id))
+        value = local() if local else None
+        if value is not None:
+            self.stats["local_hits"] += 1
+            return value
+        entry = self._cache.get(key)
+        if entry is not None:
+            if entry[0] > time_gs.monotonic():
+                self._cache.move_to_end(key)
+                if entry[1] is _NOT_FOUND:
+                    self.stats["negative_hits"] += 1
+                    return None
+                self.stats["hits"] += 1
+                return entry[1]
+            del self._cache[key]
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            try:
+                value = await remote() if remote else None
+            except discord.NotFound:
+                value = None
+            self._store(key, value if value is not None else _NOT_FOUND,
+                        RESOLVER_TTL[kind] if value is not None else RESOLVER_NEGATIVE_TTL)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # evita el aviso de excepción no recuperada si nadie más esperaba
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def channel(self, channel_id):
+        channel_id = int(channel_id)
+        return await self._resolve("channel", channel_id, lambda: client.get_channel(channel_id),
+                                   lambda: client.fetch_channel(channel_id))
+
+    async def user(self, user_id):
+        user_id = int(user_id)
+        return await self._resolve("user", user_id, lambda: client.get_user(user_id),
+                                   lambda: client.fetch_user(user_id))
+
+    async def role(self, role_id):
+        role_id = int(role_id)
+        def local():
+            for guild in client.guilds:
+                role = guild.get_role(role_id)
+                if role is not None:
+                    return role
+            return None
+        # Los roles siempre están en la caché del guild: no hay fetch, sólo el negativo
+        return await self._resolve("role", role_id, local, None)
+
+    async def message(self, channel, message_id):
+        message_id = int(message_id)
+        return await self._resolve("message", message_id, None, lambda: channel.fetch_message(message_id))
+
+    def metrics(self):
+        return {**self.stats, "entries": len(self._cache), "inflight": len(self._inflight)}
+
+
+discord_resolver = DiscordResolver()
+
+# --- BASE DE DATOS ---
+DB_PATH = os.getenv("DATABASE_PATH") or os.path.join(os.path.dirname(__file__), 'database.db')
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = 5000
+DB_STATEMENT_CACHE = 256  # sentencias preparadas cacheadas por conexión
+
+
+class SQLitePool:
+    """Pool de conexiones SQLite persistentes compartido por el loop de discord.py y los hilos de lectura.
+
+    Cada conexión se abre una sola vez (WAL, synchronous=NORMAL, busy_timeout) y conserva
+    su caché de sentencias preparadas entre usos. `connection()` la presta en exclusiva al
+    hilo que la pide y hace commit/rollback al devolverla.
+    """
+
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._open()
+                self._all.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError("database pool exhausted")
+
+    def _release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        finally:
+            self._idle.put(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    def close_all(self):
+        with self._lock:
+            conns, self._all = self._all, []
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"!!! [DB POOL CLOSE]: {e}")
+
+
+db_pool = SQLitePool(DB_PATH)
+atexit.register(db_pool.close_all)
+_db_read_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db-read")
+
+async def run_db(fn, *args):
+    """Lecturas SQLite desde el loop sin bloquearlo (las escrituras van por message_ingestor.run)."""
+    return await asyncio.get_running_loop().run_in_executor(_db_read_executor, fn, *args)
+
+# --- MIGRACIONES DE ESQUEMA ---
+# Cada migración corre una sola vez, en su propia transacción, y deja PRAGMA user_version
+# apuntando a su número. Para cambiar el esquema: añadir una función y su entrada al final.
+
+def _m001_base_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER,
+            channel_name TEXT,
+            author_name TEXT,
+            author_avatar TEXT,
+            content TEXT,
+            author_id INTEGER,
+            message_id INTEGER UNIQUE,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            components TEXT DEFAULT NULL,
+            embeds TEXT DEFAULT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS thping_schedules (
+            guild_id TEXT NOT NULL,
+            channel_id TEXT NOT NULL,
+            region TEXT NOT NULL,
+            last_ping_ts INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, region)
+        )
+    """)
+    # Bases de datos anteriores a author_id/components/embeds
+    cols = [r['name'] for r in conn.execute("PRAGMA table_info(messages)").fetchall()]
+    if 'author_id' not in cols:
+        conn.execute("ALTER TABLE messages ADD COLUMN author_id INTEGER")
+    if 'components' not in cols:
+        conn.execute("ALTER TABLE messages ADD COLUMN components TEXT DEFAULT NULL")
+    if 'embeds' not in cols:
+        conn.execute("ALTER TABLE messages ADD COLUMN embeds TEXT DEFAULT NULL")
+
+def _m002_messages_channel_index(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_channel_msg ON messages (channel_id, message_id)")
+
+def _m003_channels_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS channels (
+            channel_id INTEGER PRIMARY KEY,
+            channel_name TEXT,
+            last_message_id INTEGER,
+            message_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        INSERT OR REPLACE INTO channels (channel_id, channel_name, last_message_id, message_count)
+        SELECT agg.channel_id, m.channel_name, agg.last_id, agg.n
+        FROM (
+            SELECT channel_id, MAX(message_id) AS last_id, COUNT(*) AS n
+            FROM messages WHERE channel_id IS NOT NULL GROUP BY channel_id
+        ) agg
+        LEFT JOIN messages m ON m.message_id = agg.last_id
+    """)
+    # Mantenida por triggers para que cualquier ruta de escritura la actualice
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_messages_insert_channels AFTER INSERT ON messages
+        WHEN new.channel_id IS NOT NULL
+        BEGIN
+            INSERT INTO channels (channel_id, channel_name, last_message_id, message_count)
+            VALUES (new.channel_id, new.channel_name, new.message_id, 1)
+            ON CONFLICT(channel_id) DO UPDATE SET
+                channel_name = CASE WHEN excluded.last_message_id >= IFNULL(channels.last_message_id, 0)
+                                    THEN excluded.channel_name ELSE channels.channel_name END,
+                last_message_id = MAX(IFNULL(channels.last_message_id, 0), excluded.last_message_id),
+                message_count = channels.message_count + 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_messages_delete_channels AFTER DELETE ON messages
+        WHEN old.channel_id IS NOT NULL
+        BEGIN
+            UPDATE channels SET message_count = MAX(message_count - 1, 0)
+            WHERE channel_id = old.channel_id;
+        END
+    """)
+
+def _m004_ep_ledger(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ep_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            region TEXT NOT NULL,
+            username TEXT NOT NULL,
+            delta INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            synced_at INTEGER DEFAULT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ep_ledger_pending ON ep_ledger (region, username) WHERE synced_at IS NULL")
+
+def _m005_tickets(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tickets (
+            channel_id INTEGER PRIMARY KEY,
+            guild_id INTEGER,
+            owner_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open',
+            opened_at INTEGER NOT NULL,
+            closed_at INTEGER DEFAULT NULL,
+            closed_by INTEGER DEFAULT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_owner ON tickets (owner_id, status)")
+
+def _m006_deadlines(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS deadlines (
+            message_id INTEGER PRIMARY KEY,
+            channel_id INTEGER NOT NULL,
+            target_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            due_at INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open',
+            resolved_at INTEGER DEFAULT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deadlines_open ON deadlines (due_at) WHERE status='open'")
+
+def _m007_thping_next_ping(conn):
+    cols = [r['name'] for r in conn.execute("PRAGMA table_info(thping_schedules)").fetchall()]
+    if 'next_ping_ts' not in cols:
+        conn.execute("ALTER TABLE thping_schedules ADD COLUMN next_ping_ts INTEGER")
+    conn.execute("UPDATE thping_schedules SET next_ping_ts = last_ping_ts + ? WHERE next_ping_ts IS NULL",
+                 (THPING_INTERVAL_SECONDS,))
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_thping_next ON thping_schedules (next_ping_ts)")
+
+def _fts_embed_text_sql(col):
+    """Expresión SQL con el texto buscable de un JSON de embeds: títulos, descripciones y campos.
+
+    Sólo funciones json nativas de SQLite, para que los triggers funcionen desde cualquier
+    cliente; un JSON inválido cuenta como sin embeds en vez de romper el INSERT.
+    """
+    src = f"CASE WHEN json_valid({col}) THEN {col} END"
+    return f"""(SELECT group_concat(v, ' ') FROM (
+        SELECT json_extract(e.value, '$.title') AS v FROM json_each({src}) e
+        UNION ALL SELECT json_extract(e.value, '$.description') FROM json_each({src}) e
+        UNION ALL SELECT json_extract(f.value, '$.name') || ' ' || json_extract(f.value, '$.value')
+            FROM json_each({src}) e, json_each(e.value, '$.fields') f))"""
+
+def _m008_messages_fts(conn):
+    # FTS5 de contenido externo sobre una vista: el texto no se duplica en disco y
+    # snippet() lo lee de messages por id
+    conn.execute(f"""
+        CREATE VIEW IF NOT EXISTS messages_fts_source AS
+        SELECT id, content, {_fts_embed_text_sql('embeds')} AS embed_text FROM messages
+    """)
+    try:
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                content, embed_text,
+                content='messages_fts_source', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        # SQLite compilado sin FTS5: /api/search responde 501 y el resto sigue igual
+        logger.error(f"!!! [DB MIGRATION] FTS5 no disponible, búsqueda desactivada: {e}")
+        return
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_insert AFTER INSERT ON messages
+        BEGIN
+            INSERT INTO messages_fts (rowid, content, embed_text)
+            VALUES (new.id, new.content, {_fts_embed_text_sql('new.embeds')});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_delete AFTER DELETE ON messages
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, embed_text)
+            VALUES ('delete', old.id, old.content, {_fts_embed_text_sql('old.embeds')});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_update AFTER UPDATE OF content, embeds ON messages
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, embed_text)
+            VALUES ('delete', old.id, old.content, {_fts_embed_text_sql('old.embeds')});
+            INSERT INTO messages_fts (rowid, content, embed_text)
+            VALUES (new.id, new.content, {_fts_embed_text_sql('new.embeds')});
+        END
+    """)
+    # Carga inicial a mano: 'rebuild' no acepta una vista con subconsultas correlacionadas
+    conn.execute("INSERT INTO messages_fts (rowid, content, embed_text) SELECT id, content, embed_text FROM messages_fts_source")
+
+def _m009_ticket_archive(conn):
+    cols = [r['name'] for r in conn.execute("PRAGMA table_info(tickets)").fetchall()]
+    if 'archived_at' not in cols:
+        conn.execute("ALTER TABLE tickets ADD COLUMN archived_at INTEGER DEFAULT NULL")
+    if 'archived_messages' not in cols:
+        conn.execute("ALTER TABLE tickets ADD COLUMN archived_messages INTEGER DEFAULT NULL")
+
+def _m010_ep_inflight(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ep_inflight (
+            region TEXT NOT NULL,
+            uname TEXT NOT NULL,
+            max_id INTEGER NOT NULL,
+            expected INTEGER NOT NULL,
+            PRIMARY KEY (region, uname)
+        )
+    """)
+
+SCHEMA_MIGRATIONS = [
+    (1, "tablas base messages/thping_schedules", _m001_base_schema),
+    (2, "índice messages(channel_id, message_id)", _m002_messages_channel_index),
+    (3, "tabla channels mantenida por triggers", _m003_channels_table),
+    (4, "tabla ep_ledger (EP pendientes de volcar a Sheets)", _m004_ep_ledger),
+    (5, "tabla tickets (dueño, estado, apertura/cierre)", _m005_tickets),
+    (6, "tabla deadlines (confirmaciones pendientes)", _m006_deadlines),
+    (7, "thping_schedules.next_ping_ts indexado", _m007_thping_next_ping),
+    (8, "índice FTS5 messages_fts (contenido + embeds) mantenido por triggers", _m008_messages_fts),
+    (9, "tickets.archived_at/archived_messages (transcripciones archivadas)", _m009_ticket_archive),
+    (10, "tabla ep_inflight (EP enviados a Sheets sin confirmar)", _m010_ep_inflight),
+]
+
+def migrate_db(target_version=None):
+    """Aplica en orden las migraciones pendientes. Devuelve la versión final del esquema.
+
+    Si una migración falla se deshace y se lanza RuntimeError: el resto del bot asume el
+    esquema completo, así que arrancar con uno a medias no es una opción.
+    """
+    with db_pool.connection() as conn:
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, description, migration in SCHEMA_MIGRATIONS:
+            if version <= current or (target_version is not None and version > target_version):
+                continue
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                migration(conn)
+                conn.execute(f"PRAGMA user_version={version}")
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"!!! [DB MIGRATION] v{version} ({description}) falló: {e}")
+                raise RuntimeError(f"Migración v{version} fallida; el esquema sigue en v{current}") from e
+            current = version
+            logger.info(f">>> [DB MIGRATION] v{version}: {description}")
+        return current
+
+DB_VACUUM_CONVERT = os.getenv("DB_VACUUM_CONVERT", "0").lower() in ("1", "true", "yes")
+
+def enable_incremental_vacuum():
+    """Pasa la BD a auto_vacuum=INCREMENTAL para poder devolver espacio con incremental_vacuum.
+
+    No es una migración porque en una BD con tablas el cambio sólo se aplica con un VACUUM
+    completo, que no puede ir dentro de la transacción de migrate_db. Una BD nueva (sin
+    tablas) se crea ya en INCREMENTAL; una existente sólo se convierte con DB_VACUUM_CONVERT=1,
+    porque el VACUUM reescribe todo el fichero, bloquea el arranque y necesita ~2x su tamaño
+    libre en disco. Se hace una vez; después es un PRAGMA.
+    """
+    with db_pool.connection() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        if conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+            # Vacía: el VACUUM es inmediato (en WAL el cambio no se aplica sin él)
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            return
+        size = sum(os.path.getsize(p) for p in (DB_PATH, DB_PATH + "-wal") if os.path.exists(p))
+        if not DB_VACUUM_CONVERT:
+            logger.warning(f"[DB] auto_vacuum no es INCREMENTAL: el espacio de los tickets archivados no se "
+                           f"devuelve al disco. Arranca una vez con DB_VACUUM_CONVERT=1 para convertirla "
+                           f"(VACUUM completo de {size / 1e6:.0f} MB)")
+            return
+        free = shutil.disk_usage(os.path.dirname(os.path.abspath(DB_PATH))).free
+        if free < 2 * size:
+            logger.error(f"!!! [DB VACUUM SETUP] Espacio libre insuficiente para el VACUUM "
+                         f"({free / 1e6:.0f} MB libres, hacen falta ~{2 * size / 1e6:.0f} MB); no se convierte")
+            return
+        logger.warning(f"[DB] VACUUM completo de {size / 1e6:.0f} MB para activar auto_vacuum=INCREMENTAL; "
+                       f"el bot no arranca hasta que termine")
+        t0 = time_gs.perf_counter()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        logger.info(f">>> [DB] auto_vacuum=INCREMENTAL activado ({time_gs.perf_counter() - t0:.1f}s de VACUUM)")
+
+try:
+    enable_incremental_vacuum()  # antes de migrate_db: en una BD nueva no hace falta VACUUM
+except sqlite3.Error as e:
+    logger.error(f"!!! [DB VACUUM SETUP]: {e}")
+migrate_db()
+
+_MESSAGE_INSERT_SQL = """
+    INSERT OR IGNORE INTO messages 
+    (channel_id, channel_name, author_name, author_avatar, content, author_id, message_id, timestamp, components, embeds) 
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+def _message_row(message):
+    """Serializa un discord.Message a la tupla que espera _MESSAGE_INSERT_SQL."""
+    comps = None
+    if message.components:
+        try:
+            comps = json_mod.dumps([
+                {
+                    'type': row.type.value if hasattr(row.type, 'value') else int(row.type),
+                    'components': [{
+                        'type': c.type.value if hasattr(c.type, 'value') else int(c.type),
+                        'custom_id': getattr(c, 'custom_id', None),
+                        'label': getattr(c, 'label', None),
+                        'style': c.style.value if hasattr(getattr(c, 'style', None), 'value') else getattr(c, 'style', None),
+                        'emoji': {'name': c.emoji.name, 'id': str(c.emoji.id) if c.emoji.id else None} if getattr(c, 'emoji', None) else None,
+                        'url': getattr(c, 'url', None),
+                        'disabled': getattr(c, 'disabled', False),
+                    } for c in row.children]
+                } for row in message.components
+            ])
+        except Exception as e:
+            logger.error(f"!!! [COMPONENTS SERIALIZE]: {e}")
+
+    embeds_json = None
+    if message.embeds:
+        try:
+            embeds_json = json_mod.dumps([e.to_dict() for e in message.embeds])
+        except Exception as e:
+            logger.error(f"!!! [EMBEDS SERIALIZE]: {e}")
+
+    return (message.channel.id, message.channel.name, message.author.name, 
+            str(message.author.avatar.url) if message.author.avatar else "https://cdn.discordapp.com/embed/avatars/0.png",
+            message.content, getattr(message.author, 'id', None), message.id, message.created_at.isoformat(), comps, embeds_json)
+
+_MESSAGE_COLUMNS = ('channel_id', 'channel_name', 'author_name', 'author_avatar', 'content',
+                    'author_id', 'message_id', 'timestamp', 'components', 'embeds')
+
+def _insert_message_rows(rows):
+    with db_pool.connection() as conn:
+        conn.executemany(_MESSAGE_INSERT_SQL, rows)
+
+def _message_payload(d):
+    """Fila de messages (dict) -> objeto JSON que consumen script.js/mobile.js."""
+    d['channel_id'] = str(d['channel_id']) if d.get('channel_id') else None
+    d['message_id'] = str(d['message_id']) if d.get('message_id') else None
+    d['author_id'] = str(d['author_id']) if d.get('author_id') else None
+    # Parsear embeds y components de string JSON a objeto
+    for fld in ('embeds', 'components'):
+        raw = d.get(fld)
+        if raw:
+            try:
+                d[fld] = json_mod.loads(raw)
+            except Exception:
+                d[fld] = None
+        else:
+            d[fld] = None
+    return d
+
+# --- INGESTA DE MENSAJES (cola acotada + hilo escritor) ---
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "5000"))
+INGEST_BATCH_MAX = int(os.getenv("INGEST_BATCH_MAX", "200"))
+INGEST_SHUTDOWN_TIMEOUT = 15  # segundos para vaciar la cola al cerrar
+
+
+class MessageIngestor:
+    """Saca las escrituras SQLite del loop de discord.py.
+
+    `submit()` sólo encola la fila; una tarea del loop agrupa lo pendiente y lo escribe en
+    una única transacción en un hilo dedicado. Si la cola se llena, `submit()` espera
+    (backpressure) en vez de crecer sin límite, y se contabiliza en `metrics()`. Tras
+    `stop()` el hilo ya no existe: lo que llegue tarde se descarta y se cuenta.
+    """
+
+    def __init__(self, maxsize=INGEST_QUEUE_MAX, batch_max=INGEST_BATCH_MAX):
+        self.maxsize = maxsize
+        self.batch_max = batch_max
+        self.queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._pending_ids = set()  # message_id encolados que aún no están en disco
+        self._after_write = {}     # message_id -> callbacks async a correr cuando su fila esté escrita
+        self._stopped = False
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "failed": 0,
+            "dropped_after_stop": 0,
+            "batches": 0,
+            "max_batch": 0,
+            "max_depth": 0,
+            "backpressure_waits": 0,
+            "backpressure_wait_ms": 0.0,
+        }
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self._task = asyncio.get_running_loop().create_task(self._drain())
+        logger.info(f">>> [INGEST] Writer iniciado (queue={self.maxsize}, batch={self.batch_max})")
+
+    async def run(self, fn, *args):
+        """Ejecuta `fn` en el hilo escritor (serializado con los lotes de ingesta)."""
+        if self._stopped:
+            raise RuntimeError("El writer de SQLite está detenido")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def submit(self, row):
+        if self._stopped:
+            # Eventos que discord.py entrega mientras se cierra el cliente
+            self._stats["dropped_after_stop"] += 1
+            return
+        if not self.running:
+            await self.run(_insert_message_rows, [row])
+            self._stats["written"] += 1
+            message_cache.invalidate([row[0]])
+            _publish_written([row])
+            return
+        self._pending_ids.add(row[6])
+        if self.queue.full():
+            self._stats["backpressure_waits"] += 1
+            t0 = time_gs.perf_counter()
+            await self.queue.put(row)
+            self._stats["backpressure_wait_ms"] += (time_gs.perf_counter() - t0) * 1000
+        else:
+            self.queue.put_nowait(row)
+        self._stats["enqueued"] += 1
+        depth = self.queue.qsize()
+        if depth > self._stats["max_depth"]:
+            self._stats["max_depth"] = depth
+
+    def _take_batch(self, first):
+        batch = [first]
+        while len(batch) < self.batch_max:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    def after_write(self, message_id, callback):
+        """Si `message_id` sigue en la cola, `callback()` (async) se ejecuta cuando su fila
+        esté escrita y devuelve True. Si no (ya en disco o nunca encolado), devuelve False."""
+        if message_id not in self._pending_ids:
+            return False
+        self._after_write.setdefault(message_id, []).append(callback)
+        return True
+
+    async def _write_batch(self, batch):
+        written = False
+        try:
+            await self.run(_insert_message_rows, batch)
+            written = True
+            message_cache.invalidate(row[0] for row in batch)
+            self._stats["written"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+        except Exception as e:
+            self._stats["failed"] += len(batch)
+            logger.error(f"!!! [INGEST WRITE] {len(batch)} filas perdidas: {e}")
+        callbacks = []
+        for row in batch:
+            self._pending_ids.discard(row[6])
+            callbacks.extend(self._after_write.pop(row[6], ()))
+        if not written:
+            return
+        # El evento "message" sale con la fila ya confirmada: quien pida /api/messages,
+        # edite o borre tras recibirlo la encuentra. Después, lo que esperaba a la fila.
+        _publish_written(batch)
+        for callback in callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"!!! [INGEST AFTER WRITE]: {e}")
+
+    async def _drain(self):
+        while True:
+            batch = self._take_batch(await self.queue.get())
+            try:
+                await self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def stop(self):
+        """Vacía la cola en disco y para el writer. Se llama desde client.close()."""
+        if self.queue is not None and self.running:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=INGEST_SHUTDOWN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.error(f"!!! [INGEST] Timeout vaciando la cola ({self.queue.qsize()} pendientes)")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Lo que quede (timeout o writer caído) se escribe de forma síncrona
+        leftover = []
+        while self.queue is not None and not self.queue.empty():
+            leftover.append(self.queue.get_nowait())
+            self.queue.task_done()
+        if leftover:
+            await self._write_batch(leftover)
+        self._task = None
+        self._stopped = True
+        # Si el timeout dejó un lote en el hilo, esperarlo aquí bloquearía el loop
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        logger.info(f">>> [INGEST] Writer detenido ({self._stats['written']} filas escritas)")
+
+    def metrics(self):
+        depth = self.queue.qsize() if self.queue is not None else 0
+        return dict(self._stats, depth=depth, capacity=self.maxsize, running=self.running)
+
+
+message_ingestor = MessageIngestor()
+
+def _publish_written(rows):
+    for row in rows:
+        if message_broker.has_subscribers(row[0]):
+            message_broker.publish(row[0], "message", _message_payload(dict(zip(_MESSAGE_COLUMNS, row))))
+
+# --- LIVE STREAM: fan-out en proceso hacia el dashboard ---
+STREAM_SUBSCRIBER_QUEUE = 256
+STREAM_KEEPALIVE_SECONDS = 15
+
+
+class _StreamSubscription:
+    def __init__(self, broker, channel_id, loop):
+        self.broker = broker
+        self.channel_id = channel_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=STREAM_SUBSCRIBER_QUEUE)
+        self.overflowed = False
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Cliente lento: se descartan eventos y se le pide que resincronice por polling
+            if not self.overflowed:
+                self.overflowed = True
+                self.broker.dropped += 1
+
+    def deliver(self, event):
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._put(event)
+        else:
+            self.loop.call_soon_threadsafe(self._put, event)
+
+
+class MessageBroker:
+    """Reparte eventos message/edit/delete/resync a los suscriptores de cada canal.
+
+    `publish()` es thread-safe y nunca bloquea; cada suscriptor recibe los eventos en
+    su propio loop (el del servidor web).
+    """
+
+    def __init__(self):
+        self._subs = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, channel_id):
+        sub = _StreamSubscription(self, str(channel_id) if channel_id else None, asyncio.get_running_loop())
+        with self._lock:
+            self._subs.setdefault(sub.channel_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.channel_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.channel_id]
+
+    def publish(self, channel_id, event_type, data):
+        key = str(channel_id) if channel_id else None
+        with self._lock:
+            targets = list(self._subs.get(key, ())) + (list(self._subs.get(None, ())) if key else [])
+        if not targets:
+            return
+        self.published += 1
+        event = (event_type, data)
+        for sub in targets:
+            sub.deliver(event)
+
+    def has_subscribers(self, channel_id):
+        """Si alguien recibiría un evento de `channel_id`: así se evita construir el payload."""
+        with self._lock:
+            return bool(self._subs.get(str(channel_id) if channel_id else None) or self._subs.get(None))
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subs.values())
+
+
+message_broker = MessageBroker()
+
+# --- CACHÉ DE RESPUESTAS DE /api/messages ---
+MESSAGE_CACHE_MAX = int(os.getenv("MESSAGE_CACHE_MAX", "512"))
+MESSAGE_CACHE_MENTIONS_TTL = 60  # los nombres de las menciones cambian sin tocar la BD
+COMPRESS_MIN_BYTES = 1024
+try:
+    import brotli  # opcional: si no está, sólo gzip
+except ImportError:
+    brotli = None
+
+
+class _CachedResponse:
+    __slots__ = ("generation", "etag", "raw", "encoded", "expires")
+
+    def __init__(self, generation, etag, raw, expires):
+        self.generation = generation
+        self.etag = etag
+        self.raw = raw
+        self.encoded = {}
+        self.expires = expires
+
+    def body_for(self, accept_encoding):
+        """(cuerpo, Content-Encoding) según Accept-Encoding; comprime una vez y lo guarda."""
+        if len(self.raw) < COMPRESS_MIN_BYTES:
+            return self.raw, None
+        accepted = set()
+        for token in accept_encoding.lower().split(","):
+            name, _, params = token.strip().partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                accepted.add(name.strip())
+        for encoding in (("br",) if brotli else ()) + ("gzip",):
+            if encoding in accepted:
+                if encoding not in self.encoded:
+                    if encoding == "br":
+                        self.encoded[encoding] = brotli.compress(self.raw, quality=5)
+                    else:
+                        self.encoded[encoding] = gzip.compress(self.raw, compresslevel=6)
+                return self.encoded[encoding], encoding
+        return self.raw, None
+
+
+class MessageResponseCache:
+    """JSON ya serializado de /api/messages por (canal, since_id, limit, menciones).
+
+    Cada canal tiene una generación que sube cuando el writer confirma inserciones,
+    ediciones o borrados; una entrada sólo vale mientras su generación sea la actual.
+    La ETag es fuerte: canal, último message_id, generación (con un prefijo por arranque)
+    y el CRC del cuerpo, así que misma ETag implica los mismos bytes.
+    """
+
+    def __init__(self, max_entries=MESSAGE_CACHE_MAX):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._global = 0  # para las consultas sin channel_id
+        self._boot = format(int(time_gs.time()), "x")
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0, "evictions": 0}
 
-def _detect_region(member):
-    role_ids = [r.id for r in getattr(member, "roles", [])]
-    for role_id, label, cu, ce, cq in REGION_ROLES:
-        if role_id in role_ids:
-            return label, cu, ce, cq
-    return None, None, None, None
+    def generation(self, channel_id):
+        return self._global if channel_id is None else self._generations.get(channel_id, 0)
 
-def _sheet_add_ep(username, region, col_u, col_ep, col_qw):
-    try:
-        cl_u = col_letter(col_u)
-        cl_ep = col_letter(col_ep)
-        cl_qw = col_letter(col_qw)
-        tab = SHEET_TAB
-        col_data = _gs_get(f"'{tab}'!{cl_u}:{cl_u}200")
-        target_row = None
-        for i, row in enumerate(col_data):
-            row_num = i + 1
-            if row_num < SHEET_DATA_START_ROW:
-                continue
-            if row and str(row[0]).strip().lower() == username.lower():
-                target_row = row_num
-                break
-        if target_row:
-            ep_data = _gs_get(f"'{tab}'!{cl_ep}{target_row}")
-            current = 0
-            if ep_data and ep_data[0]:
-                try:
-                    current = int(ep_data[0][0])
-                except (ValueError, TypeError):
-                    current = 0
-            new_val = current + 1
-            _gs_put(f"'{tab}'!{cl_ep}{target_row}", [[str(new_val)]])
-            logger.info(f"[SHEETS] {username} ({region}) fila {target_row}: EP {current} -> {new_val}")
-            return True, f"EP updated! Total: {new_val}"
-        else:
-            occupied = [i+1 for i, row in enumerate(col_data) if i+1 >= SHEET_DATA_START_ROW and row and str(row[0]).strip()]
-            next_row = (max(occupied) + 1) if occupied else SHEET_DATA_START_ROW
-            _gs_put(f"'{tab}'!{cl_u}{next_row}", [[username]])
-            _gs_put(f"'{tab}'!{cl_ep}{next_row}", [["1"]])
-            _gs_put(f"'{tab}'!{cl_qw}{next_row}", [["0"]])
-            logger.info(f"[SHEETS] Nuevo {username} ({region}) fila {next_row}: EP=1")
-            return True, "Added to tracker! EP: 1"
-    except Exception as e:
-        logger.error(f"[SHEETS] Error para {username}: {e}")
-        return False, f"{type(e).__name__}: {e}"
+    def invalidate(self, channel_ids):
+        for cid in set(channel_ids):
+            self._generations[cid] = self._generations.get(cid, 0) + 1
+            self.stats["invalidations"] += 1
+        self._global += 1
 
-raw_id = os.getenv("CATEGORY_ID")
-if not raw_id:
-    logger.warning("Variable CATEGORY_ID no encontrada. Usando 0.")
-    TARGET_CATEGORY_ID = 0
-else:
-    try:
-        TARGET_CATEGORY_ID = int(raw_id)
-    except ValueError:
-        TARGET_CATEGORY_ID = 0
-        logger.error("CATEGORY_ID no es numérico")
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.generation != self.generation(key[0]) or (entry.expires and entry.expires < time_gs.monotonic()):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry
 
-# --- SETUP DISCORD BOT ---
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-intents.guilds = True
-intents.guild_messages = True
-intents.reactions = True
+    def put(self, key, generation, payload, newest_id, ttl=None):
+        self.stats["misses"] += 1
+        raw = json_mod.dumps(payload).encode()
+        etag = f'"{key[0] or "all"}-{newest_id or 0}-{self._boot}.{generation}-{zlib.crc32(raw):08x}"'
+        entry = _CachedResponse(generation, etag, raw, time_gs.monotonic() + ttl if ttl else None)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+        return entry
 
-# Prefix mantenido por compatibilidad de librerías, pero los comandos funcionales son Slash
-client = commands.Bot(command_prefix="!", intents=intents)
-bot_ready_event = threading.Event()
+    def metrics(self):
+        return {**self.stats, "entries": len(self._entries), "brotli": brotli is not None}
 
-# --- BASE DE DATOS ---
-def get_db_connection():
-    DB_PATH = os.path.join(os.path.dirname(__file__), 'database.db')
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
 
-def init_db():
-    try:
-        conn = get_db_connection()
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_id INTEGER,
-                channel_name TEXT,
-                author_name TEXT,
-                author_avatar TEXT,
-                content TEXT,
-                author_id INTEGER,
-                message_id INTEGER UNIQUE,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                components TEXT DEFAULT NULL,
-                embeds TEXT DEFAULT NULL
-            )
-        """)
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS thping_schedules (
-                guild_id TEXT NOT NULL,
-                channel_id TEXT NOT NULL,
-                region TEXT NOT NULL,
-                last_ping_ts INTEGER NOT NULL,
-                PRIMARY KEY (guild_id, region)
-            )
-        """)
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        logger.error(f"[DB ERROR]: {e}")
+message_cache = MessageResponseCache()
 
-def ensure_author_id_column():
+async def save_message_to_db(message):
+    t0 = time_gs.perf_counter()
     try:
-        conn = get_db_connection()
-        cur = conn.execute("PRAGMA table_info(messages)").fetchall()
-        cols = [r['name'] for r in cur]
-        if 'author_id' not in cols:
-            conn.execute("ALTER TABLE messages ADD COLUMN author_id INTEGER")
-            conn.commit()
-            logger.info(">>> [DB MIGRATION] Added column 'author_id'")
-        if 'components' not in cols:
-            conn.execute("ALTER TABLE messages ADD COLUMN components TEXT DEFAULT NULL")
-            conn.commit()
-            logger.info(">>> [DB MIGRATION] Added column 'components'")
-        if 'embeds' not in cols:
-            conn.execute("ALTER TABLE messages ADD COLUMN embeds TEXT DEFAULT NULL")
-            conn.commit()
-            logger.info(">>> [DB MIGRATION] Added column 'embeds'")
-        conn.close()
+        row = _message_row(message)
+        # El evento "message" lo publica el writer cuando la fila está en disco
+        await message_ingestor.submit(row)
+        METRIC_SAVE_MESSAGE.observe(time_gs.perf_counter() - t0)
     except Exception as e:
-        logger.error(f"!!! [DB CHECK ERROR]: {e}")
+        logger.error(f"!!! [SAVE ERROR]: {e}")
 
-init_db()
-ensure_author_id_column()
+# --- BACKFILL DE HISTORIAL ---
+HISTORY_CONCURRENCY = max(1, int(os.getenv("HISTORY_CONCURRENCY", "4")))
+HISTORY_CHUNK = 500  # filas por escritura durante el backfill (memoria acotada tras una caída larga)
+_history_resume_ids = {}  # channel_id -> message_id más reciente en disco al conectar
 
-async def save_message_to_db(message):
-    try:
-        conn = get_db_connection()
-        comps = None
-        if message.components:
-            try:
-                comps = json_mod.dumps([
-                    {
-                        'type': row.type.value if hasattr(row.type, 'value') else int(row.type),
-                        'components': [{
-                            'type': c.type.value if hasattr(c.type, 'value') else int(c.type),
-                            'custom_id': getattr(c, 'custom_id', None),
-                            'label': getattr(c, 'label', None),
-                            'style': c.style.value if hasattr(getattr(c, 'style', None), 'value') else getattr(c, 'style', None),
-                            'emoji': {'name': c.emoji.name, 'id': str(c.emoji.id) if c.emoji.id else None} if getattr(c, 'emoji', None) else None,
-                            'url': getattr(c, 'url', None),
-                            'disabled': getattr(c, 'disabled', False),
-                        } for c in row.children]
-                    } for row in message.components
-                ])
-            except Exception as e:
-                logger.error(f"!!! [COMPONENTS SERIALIZE]: {e}")
+def _newest_stored_message_ids():
+    with db_pool.connection() as conn:
+        rows = conn.execute("SELECT channel_id, last_message_id FROM channels").fetchall()
+    return {row["channel_id"]: row["last_message_id"] for row in rows if row["last_message_id"]}
 
-        embeds_json = None
-        if message.embeds:
-            try:
-                embeds_json = json_mod.dumps([e.to_dict() for e in message.embeds])
-            except Exception as e:
-                logger.error(f"!!! [EMBEDS SERIALIZE]: {e}")
+async def snapshot_history_resume_points():
+    """Guarda desde dónde reanudar cada canal antes de que lleguen mensajes en vivo.
 
-        conn.execute("""
-            INSERT OR IGNORE INTO messages 
-            (channel_id, channel_name, author_name, author_avatar, content, author_id, message_id, timestamp, components, embeds) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", 
-            (message.channel.id, message.channel.name, message.author.name, 
-            str(message.author.avatar.url) if message.author.avatar else "https://cdn.discordapp.com/embed/avatars/0.png",
-            message.content, getattr(message.author, 'id', None), message.id, message.created_at.isoformat(), comps, embeds_json)
-        )
-        conn.commit()
-        conn.close()
+    Si se tomara en on_ready, los mensajes recibidos tras reconectar moverían el máximo
+    y el hueco de la desconexión nunca se rellenaría.
+    """
+    try:
+        ids = await message_ingestor.run(_newest_stored_message_ids)
+        _history_resume_ids.clear()
+        _history_resume_ids.update(ids)
     except Exception as e:
-        logger.error(f"!!! [SAVE ERROR]: {e}")
+        logger.error(f"!!! [HISTORY SNAPSHOT]: {e}")
+
+async def _backfill_channel(channel, limit, semaphore):
+    async with semaphore:
+        last_id = _history_resume_ids.get(channel.id)
+        if last_id:
+            # Incremental: sólo lo posterior a lo que ya tenemos guardado
+            history = channel.history(limit=None, after=discord.Object(id=last_id), oldest_first=True)
+            mode = f"after={last_id}"
+        else:
+            history = channel.history(limit=limit)
+            mode = f"limit={limit}"
+        total, newest, chunk = 0, 0, []
+
+        async def flush():
+            nonlocal total, newest, chunk
+            if not chunk:
+                return
+            # Un executemany/transacción por trozo, en el hilo escritor
+            await message_ingestor.run(_insert_message_rows, chunk)
+            total += len(chunk)
+            newest = max(newest, max(row[6] for row in chunk))
+            if last_id:
+                # oldest_first: todo lo anterior ya está en disco, se reanuda desde aquí
+                _history_resume_ids[channel.id] = newest
+            chunk = []
+
+        try:
+            async for msg in history:
+                chunk.append(_message_row(msg))
+                if len(chunk) >= HISTORY_CHUNK:
+                    await flush()
+        except Exception as e:
+            logger.error(f"!!! [HISTORY FETCH ERROR] #{channel.name}: {e}")
+        try:
+            await flush()
+        except Exception as e:
+            logger.error(f"!!! [HISTORY WRITE ERROR] #{channel.name}: {e}")
+        if total:
+            _history_resume_ids[channel.id] = max(newest, _history_resume_ids.get(channel.id) or 0)
+            message_cache.invalidate([channel.id])
+            message_broker.publish(channel.id, "resync", {"channel_id": str(channel.id)})
+        logger.info(f">>> [HISTORY] #{channel.name}: {total} mensajes ({mode})")
+        return total
 
 async def sync_category_history(limit=200):
     try:
-        category = client.get_channel(TARGET_CATEGORY_ID)
+        try:
+            category = await discord_resolver.channel(TARGET_CATEGORY_ID)
+        except Exception:
+            category = None
         if not category:
-            try:
-                category = await client.fetch_channel(TARGET_CATEGORY_ID)
-            except Exception:
-                logger.error(f"Could not fetch category {TARGET_CATEGORY_ID}")
-                return
-        for c in getattr(category, 'channels', []):
-            if isinstance(c, discord.TextChannel):
-                logger.info(f">>> [HISTORY] Syncing #{c.name} (limit={limit})")
-                try:
-                    async for msg in c.history(limit=limit):
-                        await save_message_to_db(msg)
-                except Exception as e:
-                    logger.error(f"!!! [HISTORY FETCH ERROR] #{c.name}: {e}")
-        logger.info(">>> [HISTORY]: Sync complete.")
+            logger.error(f"Could not fetch category {TARGET_CATEGORY_ID}")
+            return
+        channels = [c for c in getattr(category, 'channels', []) if isinstance(c, discord.TextChannel)]
+        # Varios canales a la vez, con tope para no disparar el rate limit global de Discord
+        semaphore = asyncio.Semaphore(HISTORY_CONCURRENCY)
+        t0 = time_gs.perf_counter()
+        counts = await asyncio.gather(*(_backfill_channel(c, limit, semaphore) for c in channels))
+        logger.info(
+            f">>> [HISTORY]: Sync complete. {sum(counts)} mensajes en {len(channels)} canales "
+            f"({time_gs.perf_counter() - t0:.1f}s, concurrency={HISTORY_CONCURRENCY})"
+        )
     except Exception as e:
         logger.error(f"!!! [HISTORY ERROR]: {e}")
 
 # --- EVENTOS PRINCIPALES ---
+@client.event
+async def on_connect():
+    await snapshot_history_resume_points()
+
 @client.event
 async def on_ready():
     logger.info(f">>> [DISCORD]: Conectado como {client.user}")
@@ -320,11 +1893,9 @@ async def on_ready():
     except Exception as e:
         logger.error(f"!!! [SLASH SYNC ERROR]: {e}")
 
-    # Arrancar loop recurrente de thping (sólo una vez)
+    # Cargar los pings recurrentes de thping (recarga idempotente en cada reconexión)
     try:
-        if not thping_recurring_loop.is_running():
-            thping_recurring_loop.start()
-            logger.info(">>> [THPING] Loop recurrente iniciado")
+        await thping_scheduler.load()
     except Exception as e:
         logger.error(f"!!! [THPING LOOP START]: {e}")
 
@@ -336,6 +1907,22 @@ async def on_ready():
     except Exception as e:
         logger.error(f"!!! [TICKET VIEW REGISTER]: {e}")
 
+    try:
+        await ticket_index.rebuild()
+        await ticket_archiver.load()
+    except Exception as e:
+        logger.error(f"!!! [TICKET INDEX REBUILD]: {e}")
+
+    try:
+        await member_index.rebuild(client.guilds)
+    except Exception as e:
+        logger.error(f"!!! [MEMBERS INDEX REBUILD]: {e}")
+
+    try:
+        await deadline_scheduler.rehydrate()
+    except Exception as e:
+        logger.error(f"!!! [DEADLINE REHYDRATE]: {e}")
+
     # Publish the ticket panel if it's not already there
     try:
         await ensure_ticket_panel()
@@ -352,12 +1939,187 @@ async def on_ready():
         logger.error(f"!!! [HISTORY ERROR ON READY]: {e}")
 
 
+# --- REACCIONES: despacho por message_id ---
+class ReactionRouter:
+    """Tabla message_id -> (emoji, handler) para flujos que esperan una reacción concreta.
+
+    on_raw_reaction_add llega también para mensajes fuera de la caché, y encontrar el
+    handler es un dict lookup en vez de evaluar un check por cada wait_for pendiente.
+    El handler recibe el RawReactionActionEvent; las reacciones del propio bot se ignoran.
+    """
+
+    def __init__(self):
+        self.routes = {}
+
+    def register(self, message_id, handler, emoji=None):
+        self.routes[message_id] = (emoji, handler)
+
+    def unregister(self, message_id):
+        self.routes.pop(message_id, None)
+
+    async def dispatch(self, payload):
+        route = self.routes.get(payload.message_id)
+        if route is None:
+            return
+        emoji, handler = route
+        if emoji is not None and str(payload.emoji) != emoji:
+            return
+        if client.user and payload.user_id == client.user.id:
+            return
+        try:
+            await handler(payload)
+        except Exception as e:
+            logger.error(f"!!! [REACTION HANDLER] {payload.message_id}: {e}")
+
+
+reaction_router = ReactionRouter()
+
+@client.event
+async def on_raw_reaction_add(payload):
+    await reaction_router.dispatch(payload)
+
+
+# --- DEADLINES: un único planificador persistente ---
+DEADLINE_SECONDS = 86400
+DEADLINE_EMOJI = "✅"
+
+def _deadline_insert(message_id, channel_id, target_id, created_at, due_at):
+    with db_pool.connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO deadlines (message_id, channel_id, target_id, created_at, due_at, status) "
+            "VALUES (?, ?, ?, ?, ?, 'open')",
+            (message_id, channel_id, target_id, created_at, due_at)
+        )
+
+def _deadline_resolve(message_id, status, resolved_at):
+    with db_pool.connection() as conn:
+        conn.execute(
+            "UPDATE deadlines SET status=?, resolved_at=? WHERE message_id=? AND status='open'",
+            (status, resolved_at, message_id)
+        )
+
+def _deadlines_open_rows():
+    with db_pool.connection() as conn:
+        return conn.execute("SELECT message_id, channel_id, target_id, due_at FROM deadlines WHERE status='open'").fetchall()
+
+
+class DeadlineScheduler:
+    """Deadlines de confirmación guardados en la tabla deadlines y vigilados por una sola tarea.
+
+    `open` guarda message_id -> (channel_id, target_id, due_at) y `heap` los vencimientos;
+    la tarea duerme hasta el siguiente, así que cada deadline abierto cuesta una tupla y no
+    una corrutina. Se rehidrata en on_ready, y lo que venció con el bot caído expira al arrancar.
+    """
+
+    def __init__(self):
+        self.open = {}
+        self.heap = []
+        self._task = None
+        self._wake = None
+        self.stats = {"confirmed": 0, "expired": 0}
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _push(self, message_id, channel_id, target_id, due_at):
+        self.open[message_id] = (channel_id, target_id, due_at)
+        heapq.heappush(self.heap, (due_at, message_id))
+        reaction_router.register(message_id, self._on_reaction, emoji=DEADLINE_EMOJI)
+
+    async def _on_reaction(self, payload):
+        await self.confirm(payload.message_id, payload.user_id)
+
+    async def add(self, message, target_id, seconds=DEADLINE_SECONDS):
+        now = int(time_gs.time())
+        await message_ingestor.run(_deadline_insert, message.id, message.channel.id, int(target_id), now, now + seconds)
+        self._push(message.id, message.channel.id, int(target_id), now + seconds)
+        self.start()
+        self._wake.set()
+
+    async def rehydrate(self):
+        rows = await run_db(_deadlines_open_rows)
+        for message_id in self.open:
+            reaction_router.unregister(message_id)
+        self.open.clear()
+        self.heap.clear()
+        for row in rows:
+            self._push(row["message_id"], row["channel_id"], row["target_id"], row["due_at"])
+        self.start()
+        self._wake.set()
+        logger.info(f">>> [DEADLINE] {len(self.open)} deadlines pendientes rehidratados")
+
+    async def _run(self):
+        while True:
+            # Las entradas ya confirmadas siguen en el heap hasta su hora; se descartan aquí
+            while self.heap and self.open.get(self.heap[0][1], (None, None, None))[2] != self.heap[0][0]:
+                heapq.heappop(self.heap)
+            delay = self.heap[0][0] - time_gs.time() if self.heap else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+            _, message_id = heapq.heappop(self.heap)
+            try:
+                await self._expire(message_id)
+            except Exception as e:
+                logger.error(f"!!! [DEADLINE EXPIRE]: {e}")
+
+    def _channel(self, channel_id):
+        return client.get_channel(channel_id) or client.get_partial_messageable(channel_id)
+
+    async def confirm(self, message_id, user_id):
+        entry = self.open.get(message_id)
+        if entry is None or entry[1] != user_id:
+            return False
+        del self.open[message_id]
+        reaction_router.unregister(message_id)
+        channel_id, target_id, _ = entry
+        await message_ingestor.run(_deadline_resolve, message_id, "confirmed", int(time_gs.time()))
+        self.stats["confirmed"] += 1
+        sent = self._channel(channel_id).get_partial_message(message_id)
+        confirmed_embed = discord.Embed(title="Confirmed", description=f"<@{target_id}> has confirmed their availability.", color=0x26C9B8)
+        await sent.edit(embed=confirmed_embed)
+        await sent.clear_reactions()
+        logger.info(f">>> [DEADLINE] Confirmed by {target_id}")
+        return True
+
+    async def _expire(self, message_id):
+        entry = self.open.pop(message_id, None)
+        if entry is None:
+            return
+        reaction_router.unregister(message_id)
+        channel_id, target_id, _ = entry
+        await message_ingestor.run(_deadline_resolve, message_id, "expired", int(time_gs.time()))
+        self.stats["expired"] += 1
+        channel = self._channel(channel_id)
+        close_embed = discord.Embed(title="Ticket Ready to Close", description=f"<@{target_id}> did not confirm within 24h.", color=0xFF6B6B)
+        await channel.send(embed=close_embed)
+        sent = channel.get_partial_message(message_id)
+        expired_embed = discord.Embed(title="Deadline Expired", description=f"<@{target_id}> did not respond.", color=0x888888)
+        await sent.edit(embed=expired_embed)
+        await sent.clear_reactions()
+        logger.info(f">>> [DEADLINE] Expired for {target_id}")
+
+
+deadline_scheduler = DeadlineScheduler()
+
+
 # --- HANDLERS COMANDOS ---
 async def handle_deadline_interaction(interaction: discord.Interaction, user: discord.Member):
     await interaction.response.defer(ephemeral=False)
     channel = interaction.channel
     mention_str = user.mention
-    deadline_dt = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=24)
+    deadline_dt = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=DEADLINE_SECONDS)
     unix_ts = int(deadline_dt.timestamp())
     embed = discord.Embed(
         title="Deadline - Confirmation Required",
@@ -368,32 +2130,14 @@ async def handle_deadline_interaction(interaction: discord.Interaction, user: di
     
     try:
         sent = await channel.send(embed=embed)
-        await sent.add_reaction("✅")
+        await sent.add_reaction(DEADLINE_EMOJI)
+        await deadline_scheduler.add(sent, user.id)
         logger.info(f">>> [DEADLINE] Slash command: sent for {user.display_name}")
     except Exception as e:
         logger.error(f"!!! [DEADLINE SEND ERROR]: {e}")
         await interaction.followup.send("Error al enviar el deadline", ephemeral=True)
         return
-        
-    async def watch():
-        try:
-            def check(reaction, u):
-                return str(reaction.emoji) == '✅' and reaction.message.id == sent.id and user.id == u.id and not u.bot
-            await client.wait_for('reaction_add', check=check, timeout=86400)
-            confirmed_embed = discord.Embed(title="Confirmed", description=f"{mention_str} has confirmed their availability.", color=0x26C9B8)
-            await sent.edit(embed=confirmed_embed)
-            await sent.clear_reactions()
-            logger.info(f">>> [DEADLINE] Confirmed by {user.display_name}")
-        except asyncio.TimeoutError:
-            close_embed = discord.Embed(title="Ticket Ready to Close", description=f"{mention_str} did not confirm within 24h.", color=0xFF6B6B)
-            await channel.send(embed=close_embed)
-            expired_embed = discord.Embed(title="Deadline Expired", description=f"{mention_str} did not respond.", color=0x888888)
-            await sent.edit(embed=expired_embed)
-            await sent.clear_reactions()
-        except Exception as e:
-            logger.error(f"!!! [DEADLINE WATCH ERROR]: {e}")
-            
-    asyncio.create_task(watch())
+
     await interaction.followup.send("Deadline enviado.", ephemeral=True)
 
 # --- TICKET SYSTEM ---
@@ -403,6 +2147,255 @@ TICKET_CLOSE_ROLE_IDS = {1355062394547736673, 1355062394547736675, 1355062394547
 TICKET_DELETE_DELAY = 5  # seconds before closed ticket channel is deleted
 
 
+def _ticket_owner_from_topic(topic):
+    topic = topic or ""
+    if not topic.startswith("ticket-owner:"):
+        return None
+    try:
+        return int(topic.split(":", 1)[1].strip())
+    except (ValueError, IndexError):
+        return None
+
+def _ticket_open_row(channel_id, guild_id, owner_id, opened_at):
+    with db_pool.connection() as conn:
+        conn.execute(
+            "INSERT INTO tickets (channel_id, guild_id, owner_id, status, opened_at) VALUES (?, ?, ?, 'open', ?) "
+            "ON CONFLICT(channel_id) DO NOTHING",
+            (channel_id, guild_id, owner_id, opened_at)
+        )
+
+def _ticket_close_row(channel_id, status, closed_by, closed_at):
+    with db_pool.connection() as conn:
+        conn.execute(
+            "UPDATE tickets SET status=?, closed_by=COALESCE(closed_by, ?), closed_at=COALESCE(closed_at, ?) "
+            "WHERE channel_id=? AND status='open'",
+            (status, closed_by, closed_at, channel_id)
+        )
+
+def _tickets_open_rows():
+    with db_pool.connection() as conn:
+        return conn.execute("SELECT channel_id, owner_id FROM tickets WHERE status='open'").fetchall()
+
+
+class TicketIndex:
+    """owner_id <-> channel_id de los tickets abiertos, respaldado por la tabla tickets.
+
+    Se reconstruye en on_ready y se mantiene con on_guild_channel_create/delete, así que
+    comprobar si alguien ya tiene ticket o quién es el dueño de un canal es un dict lookup.
+    """
+
+    def __init__(self):
+        self.by_owner = {}
+        self.by_channel = {}
+        self.creating = set()  # owners con un canal en creación (evita dobles clicks)
+        self.closing = set()  # canales que close_ticket está borrando (los cierra él al confirmarse)
+
+    def channel_of(self, owner_id):
+        return self.by_owner.get(owner_id)
+
+    def owner_of(self, channel_id):
+        return self.by_channel.get(channel_id)
+
+    async def opened(self, channel, owner_id):
+        if self.by_channel.get(channel.id) == owner_id:
+            return
+        self.by_owner[owner_id] = channel.id
+        self.by_channel[channel.id] = owner_id
+        await message_ingestor.run(
+            _ticket_open_row, channel.id, getattr(channel.guild, 'id', None), owner_id, int(time_gs.time())
+        )
+
+    async def closed(self, channel_id, status="closed", closed_by=None):
+        owner_id = self.by_channel.pop(channel_id, None)
+        if owner_id is not None and self.by_owner.get(owner_id) == channel_id:
+            del self.by_owner[owner_id]
+        await message_ingestor.run(_ticket_close_row, channel_id, status, closed_by, int(time_gs.time()))
+
+    async def rebuild(self):
+        rows = await run_db(_tickets_open_rows)
+        self.by_owner.clear()
+        self.by_channel.clear()
+        for row in rows:
+            self.by_owner[row["owner_id"]] = row["channel_id"]
+            self.by_channel[row["channel_id"]] = row["owner_id"]
+
+        category = client.get_channel(TICKET_CATEGORY_ID)
+        if not isinstance(category, discord.CategoryChannel):
+            return
+        live = {ch.id: ch for ch in category.text_channels}
+        # Tickets borrados mientras el bot estaba desconectado
+        for channel_id in [cid for cid in self.by_channel if cid not in live]:
+            await self.closed(channel_id, status="deleted")
+        # Tickets abiertos antes de existir la tabla
+        for ch in live.values():
+            owner_id = _ticket_owner_from_topic(ch.topic)
+            if owner_id is not None and ch.id not in self.by_channel:
+                await self.opened(ch, owner_id)
+        logger.info(f">>> [TICKET] Índice reconstruido: {len(self.by_channel)} tickets abiertos")
+
+
+ticket_index = TicketIndex()
+
+# --- ARCHIVO DE TICKETS: transcripción gzip JSONL al cerrar y poda de messages ---
+# Sólo se guardan mensajes de TARGET_CATEGORY_ID (on_message), así que las transcripciones
+# sólo tienen contenido si los tickets viven en esa categoría (TICKET_CATEGORY_ID); si no
+# coinciden se avisa al arrancar. Únicamente se archivan canales de la tabla tickets ya cerrados.
+TICKET_ARCHIVE_DIR = os.getenv("TICKET_ARCHIVE_DIR") or os.path.join(os.path.dirname(DB_PATH), "ticket_archives")
+TICKET_ARCHIVE_INGEST_WAIT = 10  # segundos esperando a que el writer vacíe la cola
+VACUUM_INTERVAL_SECONDS = int(os.getenv("VACUUM_INTERVAL_SECONDS", "3600"))
+VACUUM_PAGES_PER_STEP = 1000  # páginas liberadas por paso; entre pasos vuelve a entrar la ingesta
+
+
+def _ticket_archive_path(channel_id):
+    return os.path.join(TICKET_ARCHIVE_DIR, f"ticket-{int(channel_id)}.jsonl.gz")
+
+def _archive_ticket_rows(channel_id):
+    """Vuelca los mensajes del canal a su .jsonl.gz y los borra de messages en una transacción.
+
+    El fichero se escribe en .tmp y se renombra antes del COMMIT: si algo falla, las filas
+    siguen en messages y el siguiente intento lo rehace. Si ya había archivo (un cierre
+    anterior del mismo canal), se conserva y sólo se añaden los mensajes que no tenía.
+    """
+    path = _ticket_archive_path(channel_id)
+    tmp = path + ".tmp"
+    archived = 0
+    with db_pool.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        ticket = conn.execute("SELECT status FROM tickets WHERE channel_id=?", (channel_id,)).fetchone()
+        if ticket is None or ticket["status"] == "open":
+            return None
+        os.makedirs(TICKET_ARCHIVE_DIR, exist_ok=True)
+        rows = conn.execute("SELECT * FROM messages WHERE channel_id=? ORDER BY message_id", (channel_id,))
+        try:
+            seen = set()
+            with open(tmp, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+                    if os.path.exists(path):
+                        with gzip.open(path, "rb") as old:
+                            for line in old:
+                                seen.add(json_mod.loads(line).get("message_id"))
+                                out.write(line)
+                    for row in rows:
+                        payload = _message_payload(dict(row))
+                        if payload["message_id"] in seen:
+                            continue
+                        out.write(json_mod.dumps(payload, ensure_ascii=False).encode() + b"\n")
+                        archived += 1
+                raw.flush()
+                os.fsync(raw.fileno())
+            if archived or seen:
+                os.replace(tmp, path)
+            else:
+                os.remove(tmp)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            raise
+        deleted = conn.execute("DELETE FROM messages WHERE channel_id=?", (channel_id,)).rowcount
+        conn.execute("UPDATE tickets SET archived_at=?, archived_messages=COALESCE(archived_messages, 0) + ? WHERE channel_id=?",
+                     (int(time_gs.time()), archived, channel_id))
+    return archived, deleted
+
+def _tickets_unarchived():
+    with db_pool.connection() as conn:
+        return [row[0] for row in conn.execute("SELECT channel_id FROM tickets WHERE status!='open' AND archived_at IS NULL")]
+
+def _incremental_vacuum(max_pages):
+    with db_pool.connection() as conn:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            return 0
+        # Con execute() sqlite3 da un solo paso al PRAGMA y libera una página; executescript lo completa
+        conn.executescript(f"PRAGMA incremental_vacuum({min(free, max_pages)})")
+        return free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+class TicketArchiver:
+    """Archiva los tickets cerrados y devuelve al sistema el espacio que dejan en la BD.
+
+    Los canales se encolan al borrarse (on_guild_channel_delete) y, al arrancar, los cerrados
+    que quedaron sin archivar. El archivado y el incremental_vacuum corren en el hilo escritor
+    de message_ingestor, así que no compiten con la ingesta por el lock de escritura.
+    """
+
+    def __init__(self):
+        self.pending = set()
+        self._task = None
+        self._wake = None
+        self.stats = {"archived_tickets": 0, "archived_messages": 0, "failed": 0, "vacuumed_pages": 0}
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def load(self):
+        if TICKET_CATEGORY_ID != TARGET_CATEGORY_ID:
+            logger.error(f"!!! [TICKET ARCHIVE] TICKET_CATEGORY_ID ({TICKET_CATEGORY_ID}) != TARGET_CATEGORY_ID "
+                         f"({TARGET_CATEGORY_ID}): los mensajes de tickets no se guardan y las transcripciones saldrán vacías")
+        self.pending.update(await run_db(_tickets_unarchived))
+        self.start()
+        self._wake.set()
+
+    def archive(self, channel_id):
+        self.pending.add(channel_id)
+        self.start()
+        self._wake.set()
+
+    async def _archive(self, channel_id):
+        # Lo que aún esté en la cola de ingesta de ese canal tiene que entrar en el archivo
+        if message_ingestor.running:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(message_ingestor.queue.join(), timeout=TICKET_ARCHIVE_INGEST_WAIT)
+        try:
+            result = await message_ingestor.run(_archive_ticket_rows, channel_id)
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"!!! [TICKET ARCHIVE] {channel_id}: {e}")
+            return
+        self.pending.discard(channel_id)
+        if result is None:
+            logger.error(f"!!! [TICKET ARCHIVE] {channel_id}: no es un ticket cerrado, no se archiva")
+            return
+        archived, deleted = result
+        message_cache.invalidate([channel_id])
+        self.stats["archived_tickets"] += 1
+        self.stats["archived_messages"] += archived
+        logger.info(f">>> [TICKET ARCHIVE] {channel_id}: {archived} mensajes archivados, {deleted} filas podadas")
+
+    async def _vacuum(self):
+        while True:
+            freed = await message_ingestor.run(_incremental_vacuum, VACUUM_PAGES_PER_STEP)
+            self.stats["vacuumed_pages"] += freed
+            if freed < VACUUM_PAGES_PER_STEP:
+                return
+
+    async def _run(self):
+        while True:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), timeout=VACUUM_INTERVAL_SECONDS)
+            self._wake.clear()
+            try:
+                for channel_id in list(self.pending):
+                    await self._archive(channel_id)
+                await self._vacuum()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"!!! [DB VACUUM]: {e}")
+
+    def metrics(self):
+        return {**self.stats, "pending": len(self.pending)}
+
+
+ticket_archiver = TicketArchiver()
+
+
 class TicketFormModal(discord.ui.Modal, title="Open Ticket"):
     roblox_username = discord.ui.TextInput(
         label="Roblox Username", placeholder="Your Roblox username",
@@ -442,18 +2435,22 @@ class TicketFormModal(discord.ui.Modal, title="Open Ticket"):
             return
 
         # Prevent a single user from spamming tickets: one open ticket at a time
-        for ch in category.text_channels:
-            if (ch.topic or "").startswith(f"ticket-owner:{user.id}"):
-                await interaction.response.send_message(
-                    f"You already have an open ticket: {ch.mention}",
-                    ephemeral=True
-                )
-                return
+        existing_id = ticket_index.channel_of(user.id)
+        if existing_id is not None:
+            await interaction.response.send_message(
+                f"You already have an open ticket: <#{existing_id}>",
+                ephemeral=True
+            )
+            return
+        if user.id in ticket_index.creating:
+            await interaction.response.send_message("Your ticket is already being created.", ephemeral=True)
+            return
 
         # Sanitize username for channel name (Discord: lowercase, no spaces/special chars)
         safe_name = re_mod.sub(r'[^a-z0-9-]+', '-', user.name.lower()).strip('-') or 'user'
         channel_name = f"ticket-{safe_name}"[:90]
 
+        ticket_index.creating.add(user.id)
         try:
             ticket_channel = await guild.create_text_channel(
                 name=channel_name,
@@ -461,6 +2458,12 @@ class TicketFormModal(discord.ui.Modal, title="Open Ticket"):
                 topic=f"ticket-owner:{user.id}",
                 reason=f"Ticket opened by {user.name} ({user.id})"
             )
+            try:
+                await ticket_index.opened(ticket_channel, user.id)
+            except Exception as e:
+                # El canal ya existe y el índice en memoria ya lo tiene: el ticket funciona y
+                # la fila se recupera del topic en el próximo rebuild
+                logger.error(f"!!! [TICKET INDEX OPEN] {ticket_channel.id}: {e}")
         except discord.Forbidden:
             await interaction.response.send_message(
                 "I don't have permission to create ticket channels.",
@@ -473,6 +2476,8 @@ class TicketFormModal(discord.ui.Modal, title="Open Ticket"):
             )
             logger.error(f"!!! [TICKET CREATE ERROR]: {e}")
             return
+        finally:
+            ticket_index.creating.discard(user.id)
 
         embed = discord.Embed(
             title="🎫 New Player Ticket",
@@ -544,15 +2549,10 @@ class TicketCloseView(discord.ui.View):
         user = interaction.user
 
         # Permission check: owner of the ticket OR allowed role
-        is_owner = False
-        topic = getattr(channel, 'topic', '') or ''
-        if topic.startswith("ticket-owner:"):
-            try:
-                owner_id = int(topic.split(":", 1)[1].strip())
-                if owner_id == user.id:
-                    is_owner = True
-            except (ValueError, IndexError):
-                pass
+        owner_id = ticket_index.owner_of(channel.id)
+        if owner_id is None:
+            owner_id = _ticket_owner_from_topic(getattr(channel, 'topic', None))
+        is_owner = owner_id is not None and owner_id == user.id
 
         has_role = any(
             getattr(r, 'id', None) in TICKET_CLOSE_ROLE_IDS
@@ -565,6 +2565,9 @@ class TicketCloseView(discord.ui.View):
                 ephemeral=True
             )
             return
+        if channel.id in ticket_index.closing:
+            await interaction.response.send_message("This ticket is already being closed.", ephemeral=True)
+            return
 
         # Disable the button and show the countdown
         button.disabled = True
@@ -581,22 +2584,62 @@ class TicketCloseView(discord.ui.View):
             pass
 
         logger.info(f">>> [TICKET] Closed by {user.name} ({user.id}) in #{channel.name}")
-        await asyncio.sleep(TICKET_DELETE_DELAY)
+        # Sigue abierto en el índice hasta que el borrado se confirme: si falla, el dueño
+        # conserva su ticket y no puede abrir otro
+        ticket_index.closing.add(channel.id)
+        try:
+            await asyncio.sleep(TICKET_DELETE_DELAY)
+            try:
+                await channel.delete(reason=f"Ticket closed by {user.name}")
+            except Exception as e:
+                logger.error(f"!!! [TICKET DELETE ERROR]: {e}")
+                return
+            try:
+                await ticket_index.closed(channel.id, closed_by=user.id)
+            except Exception as e:
+                logger.error(f"!!! [TICKET INDEX CLOSE]: {e}")
+                return
+        finally:
+            ticket_index.closing.discard(channel.id)
+        ticket_archiver.archive(channel.id)
+
+
+@client.event
+async def on_guild_channel_create(channel):
+    discord_resolver.forget("channel", channel.id)
+    if getattr(channel, 'category_id', None) != TICKET_CATEGORY_ID:
+        return
+    owner_id = _ticket_owner_from_topic(getattr(channel, 'topic', None))
+    if owner_id is not None:
         try:
-            await channel.delete(reason=f"Ticket closed by {user.name}")
+            await ticket_index.opened(channel, owner_id)
         except Exception as e:
-            logger.error(f"!!! [TICKET DELETE ERROR]: {e}")
+            logger.error(f"!!! [TICKET INDEX CREATE]: {e}")
+
+@client.event
+async def on_guild_channel_delete(channel):
+    discord_resolver.forget("channel", channel.id)
+    if ticket_index.owner_of(channel.id) is None or channel.id in ticket_index.closing:
+        return  # no es un ticket, o lo está cerrando close_ticket (que lo marca y archiva)
+    try:
+        # Lo borraron a mano sin pasar por el botón
+        await ticket_index.closed(channel.id, status="deleted")
+    except Exception as e:
+        logger.error(f"!!! [TICKET INDEX DELETE]: {e}")
+        return
+    ticket_archiver.archive(channel.id)
 
 
 async def ensure_ticket_panel():
     """Ensure the ticket panel message is posted in the configured channel."""
-    channel = client.get_channel(TICKET_PANEL_CHANNEL_ID)
+    try:
+        channel = await discord_resolver.channel(TICKET_PANEL_CHANNEL_ID)
+    except Exception as e:
+        logger.error(f"!!! [TICKET PANEL] Channel {TICKET_PANEL_CHANNEL_ID} not found: {e}")
+        return
     if not channel:
-        try:
-            channel = await client.fetch_channel(TICKET_PANEL_CHANNEL_ID)
-        except Exception as e:
-            logger.error(f"!!! [TICKET PANEL] Channel {TICKET_PANEL_CHANNEL_ID} not found: {e}")
-            return
+        logger.error(f"!!! [TICKET PANEL] Channel {TICKET_PANEL_CHANNEL_ID} not found")
+        return
 
     try:
         # Check if the bot has already posted a panel message (has components) recently
@@ -623,31 +2666,34 @@ async def ensure_ticket_panel():
 
 # --- THPING: ping recurrente cada 24h por región ---
 def _thping_set_schedule(guild_id, channel_id, region, last_ping_ts):
-    try:
-        conn = get_db_connection()
+    with db_pool.connection() as conn:
         conn.execute(
-            "INSERT INTO thping_schedules (guild_id, channel_id, region, last_ping_ts) VALUES (?, ?, ?, ?) "
-            "ON CONFLICT(guild_id, region) DO UPDATE SET channel_id=excluded.channel_id, last_ping_ts=excluded.last_ping_ts",
-            (str(guild_id), str(channel_id), region, int(last_ping_ts))
+            "INSERT INTO thping_schedules (guild_id, channel_id, region, last_ping_ts, next_ping_ts) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(guild_id, region) DO UPDATE SET channel_id=excluded.channel_id, "
+            "last_ping_ts=excluded.last_ping_ts, next_ping_ts=excluded.next_ping_ts",
+            (str(guild_id), str(channel_id), region, int(last_ping_ts), int(last_ping_ts) + THPING_INTERVAL_SECONDS)
         )
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        logger.error(f"!!! [THPING DB SET]: {e}")
 
-def _thping_get_due(now_ts):
-    try:
-        conn = get_db_connection()
-        rows = conn.execute(
-            "SELECT guild_id, channel_id, region, last_ping_ts FROM thping_schedules "
-            "WHERE (? - last_ping_ts) >= ?",
-            (int(now_ts), THPING_INTERVAL_SECONDS)
+def _thping_set_next(guild_id, region, next_ping_ts):
+    with db_pool.connection() as conn:
+        conn.execute(
+            "UPDATE thping_schedules SET next_ping_ts=? WHERE guild_id=? AND region=?",
+            (int(next_ping_ts), str(guild_id), region)
+        )
+
+def _thping_mark_sent(guild_id, region, last_ping_ts):
+    # Sin tocar channel_id: si /thping movió la región durante el envío, manda el canal nuevo
+    with db_pool.connection() as conn:
+        conn.execute(
+            "UPDATE thping_schedules SET last_ping_ts=?, next_ping_ts=MAX(next_ping_ts, ?) WHERE guild_id=? AND region=?",
+            (int(last_ping_ts), int(last_ping_ts) + THPING_INTERVAL_SECONDS, str(guild_id), region)
+        )
+
+def _thping_load_schedules():
+    with db_pool.connection() as conn:
+        return conn.execute(
+            "SELECT guild_id, channel_id, region, next_ping_ts FROM thping_schedules ORDER BY next_ping_ts"
         ).fetchall()
-        conn.close()
-        return rows
-    except Exception as e:
-        logger.error(f"!!! [THPING DB GET]: {e}")
-        return []
 
 async def _thping_send(channel, region):
     role_ids = THPING_ROLES.get(region.lower())
@@ -686,7 +2732,11 @@ async def slash_thping(interaction: discord.Interaction, region: app_commands.Ch
 
     sent_ok = await _thping_send(interaction.channel, region_value)
     now_ts = int(time_gs.time())
-    _thping_set_schedule(interaction.guild_id, interaction.channel_id, region_value, now_ts)
+    try:
+        await message_ingestor.run(_thping_set_schedule, interaction.guild_id, interaction.channel_id, region_value, now_ts)
+        thping_scheduler.schedule(interaction.guild_id, interaction.channel_id, region_value, now_ts + THPING_INTERVAL_SECONDS)
+    except Exception as e:
+        logger.error(f"!!! [THPING DB SET]: {e}")
 
     if sent_ok:
         next_ts = now_ts + THPING_INTERVAL_SECONDS
@@ -703,32 +2753,111 @@ async def slash_thping(interaction: discord.Interaction, region: app_commands.Ch
         )
 
 
-@tasks.loop(minutes=5)
-async def thping_recurring_loop():
-    try:
+class ThpingScheduler:
+    """Pings recurrentes de thping_schedules con un heap de next_ping_ts y una sola tarea.
+
+    La tarea duerme hasta el siguiente vencimiento, no hasta el siguiente tick de 5 minutos.
+    Cada ping vencido se envía en su propia tarea (con timeout), así un canal lento o sin
+    permisos no retrasa al resto de regiones. Un envío fallido se reintenta a los
+    THPING_RETRY_SECONDS.
+    """
+
+    def __init__(self):
+        self.entries = {}  # (guild_id, region) -> (channel_id, next_ping_ts)
+        self.heap = []
+        self.inflight = set()
+        self._fire_tasks = set()  # referencias fuertes: el loop sólo guarda débiles
+        self._task = None
+        self._wake = None
+        self.stats = {"sent": 0, "failed": 0}
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def schedule(self, guild_id, channel_id, region, next_ping_ts):
+        key = (str(guild_id), region)
+        self.entries[key] = (str(channel_id), int(next_ping_ts))
+        heapq.heappush(self.heap, (int(next_ping_ts), key))
+        if self._wake is not None:
+            self._wake.set()
+
+    async def load(self):
+        rows = await run_db(_thping_load_schedules)
+        self.entries.clear()
+        self.heap.clear()
+        for row in rows:
+            # Los que se están enviando ya se reprograman al terminar; con la hora vieja de la
+            # BD se mandarían dos veces
+            if (str(row["guild_id"]), row["region"]) in self.inflight:
+                continue
+            self.schedule(row["guild_id"], row["channel_id"], row["region"], row["next_ping_ts"])
+        self.start()
+        self._wake.set()
+        logger.info(f">>> [THPING] {len(self.entries)} pings recurrentes cargados")
+
+    async def _run(self):
+        while True:
+            # Entradas reprogramadas desde que se apilaron: se descartan al llegar arriba
+            while self.heap and self.entries.get(self.heap[0][1], (None, None))[1] != self.heap[0][0]:
+                heapq.heappop(self.heap)
+            delay = self.heap[0][0] - time_gs.time() if self.heap else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+            _, key = heapq.heappop(self.heap)
+            if key in self.inflight:
+                continue
+            self.inflight.add(key)
+            task = asyncio.create_task(self._fire(key, self.entries[key][0]))
+            self._fire_tasks.add(task)
+            task.add_done_callback(self._fire_tasks.discard)
+
+    async def _fire(self, key, channel_id):
+        guild_id, region = key
         now_ts = int(time_gs.time())
-        due = _thping_get_due(now_ts)
-        for row in due:
-            guild_id   = row["guild_id"]
-            channel_id = row["channel_id"]
-            region     = row["region"]
-            channel = client.get_channel(int(channel_id))
+        t0 = time_gs.perf_counter()
+        try:
+            channel = await discord_resolver.channel(channel_id)
             if channel is None:
-                try:
-                    channel = await client.fetch_channel(int(channel_id))
-                except Exception as e:
-                    logger.error(f"!!! [THPING LOOP] No se pudo obtener canal {channel_id}: {e}")
-                    continue
-            sent_ok = await _thping_send(channel, region)
+                raise LookupError("canal no encontrado")
+            sent_ok = await asyncio.wait_for(_thping_send(channel, region), timeout=THPING_SEND_TIMEOUT)
+        except Exception as e:
+            logger.error(f"!!! [THPING LOOP] canal {channel_id} región {region}: {type(e).__name__}: {e}")
+            sent_ok = False
+        METRIC_THPING_FIRE.observe(time_gs.perf_counter() - t0, "sent" if sent_ok else "failed")
+        try:
             if sent_ok:
-                _thping_set_schedule(guild_id, channel_id, region, now_ts)
+                await message_ingestor.run(_thping_mark_sent, guild_id, region, now_ts)
+                next_ts = now_ts + THPING_INTERVAL_SECONDS
+                self.stats["sent"] += 1
                 logger.info(f">>> [THPING LOOP] Ping recurrente {region} enviado en canal {channel_id}")
-    except Exception as e:
-        logger.error(f"!!! [THPING LOOP]: {e}")
+            else:
+                next_ts = now_ts + THPING_RETRY_SECONDS
+                await message_ingestor.run(_thping_set_next, guild_id, region, next_ts)
+                self.stats["failed"] += 1
+            # Si /thping lo reprogramó mientras se enviaba, manda la nueva hora; si load()
+            # vació entries entre medias, la entrada no existe y se programa aquí
+            entry = self.entries.get(key)
+            if entry is None or entry[1] <= now_ts:
+                self.schedule(guild_id, channel_id, region, next_ts)
+        except Exception as e:
+            logger.error(f"!!! [THPING DB SET]: {e}")
+        finally:
+            self.inflight.discard(key)
+
 
-@thping_recurring_loop.before_loop
-async def _thping_before():
-    await client.wait_until_ready()
+thping_scheduler = ThpingScheduler()
 
 
 @client.tree.command(name="deadline", description="Envia un deadline de 24h a un usuario (solo staff)")
@@ -746,21 +2875,304 @@ async def on_message(message):
     if message.author.bot:
         return
 
-    # Guardar mensajes si el canal pertenece a la categoría target
-    if hasattr(message.channel, 'category') and message.channel.category and message.channel.category.id == TARGET_CATEGORY_ID:
-        await save_message_to_db(message)
+    with METRIC_ON_MESSAGE.time():
+        # Guardar mensajes si el canal pertenece a la categoría target
+        if hasattr(message.channel, 'category') and message.channel.category and message.channel.category.id == TARGET_CATEGORY_ID:
+            await save_message_to_db(message)
+
+        await client.process_commands(message)
+
+# --- EDICIONES/BORRADOS HECHOS EN DISCORD ---
+def _apply_message_edit(message_id, content, embeds_json):
+    with db_pool.connection() as conn:
+        return conn.execute(
+            "UPDATE messages SET content=COALESCE(?, content), embeds=COALESCE(?, embeds) WHERE message_id=?",
+            (content, embeds_json, message_id)
+        ).rowcount
+
+def _delete_stored_messages(message_ids):
+    with db_pool.connection() as conn:
+        return conn.executemany(
+            "DELETE FROM messages WHERE message_id=?", [(mid,) for mid in message_ids]
+        ).rowcount
+
+@client.event
+async def on_raw_message_edit(payload):
+    discord_resolver.forget("message", payload.message_id)
+    data = payload.data or {}
+    if 'content' not in data and 'embeds' not in data:
+        return
+    # Editado antes de que su INSERT saliera de la cola: el UPDATE no encontraría la fila
+    if message_ingestor.after_write(payload.message_id, lambda: on_raw_message_edit(payload)):
+        return
+    content = data.get('content') if 'content' in data else None
+    embeds_json = json_mod.dumps(data['embeds']) if data.get('embeds') is not None else None
+    try:
+        updated = await message_ingestor.run(_apply_message_edit, payload.message_id, content, embeds_json)
+    except Exception as e:
+        logger.error(f"!!! [EDIT SYNC]: {e}")
+        return
+    # Sólo mensajes que tenemos guardados (canales de la categoría target)
+    if updated:
+        message_cache.invalidate([payload.channel_id])
+        event = {"message_id": str(payload.message_id)}
+        if content is not None:
+            event["content"] = content
+        if embeds_json is not None:
+            event["embeds"] = data['embeds']
+        message_broker.publish(payload.channel_id, "edit", event)
+
+async def _sync_deleted(channel_id, message_ids):
+    for mid in message_ids:
+        discord_resolver.forget("message", mid)
+    # Los que aún están en la cola de ingesta se borran en cuanto se escriban
+    message_ids = [mid for mid in message_ids
+                   if not message_ingestor.after_write(mid, lambda mid=mid: _sync_deleted(channel_id, [mid]))]
+    if not message_ids:
+        return
+    try:
+        deleted = await message_ingestor.run(_delete_stored_messages, list(message_ids))
+    except Exception as e:
+        logger.error(f"!!! [DELETE SYNC]: {e}")
+        return
+    if deleted:
+        message_cache.invalidate([channel_id])
+        for mid in message_ids:
+            message_broker.publish(channel_id, "delete", {"message_id": str(mid)})
+
+@client.event
+async def on_raw_message_delete(payload):
+    await _sync_deleted(payload.channel_id, [payload.message_id])
+
+@client.event
+async def on_raw_bulk_message_delete(payload):
+    await _sync_deleted(payload.channel_id, payload.message_ids)
+
+# --- ÍNDICE DE MIEMBROS Y ROLES (autocompletado de menciones) ---
+MEMBER_SEARCH_MAX = 50
+
+
+class _PrefixIndex:
+    """Lista ordenada de "término\0id": la búsqueda por prefijo es un bisect + recorrido.
+
+    Claves str y no tuplas: ordenar y comparar strings es bastante más barato.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.terms = {}  # id -> términos indexados
+
+    @staticmethod
+    def terms_for(*names):
+        terms = set()
+        for name in names:
+            name = (name or "").lower().strip()
+            if name:
+                terms.add(name)
+                terms.update(word for word in name.split() if word)
+        return terms
+
+    def put(self, item_id, terms):
+        self.remove(item_id)
+        self.terms[item_id] = terms
+        for term in terms:
+            bisect.insort(self.keys, f"{term}\0{item_id}")
+
+    def remove(self, item_id):
+        for term in self.terms.pop(item_id, ()):
+            key = f"{term}\0{item_id}"
+            i = bisect.bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                del self.keys[i]
+
+    def rebuild(self, items):
+        self.terms = dict(items)
+        self.keys = sorted(f"{term}\0{item_id}" for item_id, terms in self.terms.items() for term in terms)
+
+    def search(self, prefix, limit):
+        found = []
+        seen = set()
+        i = bisect.bisect_left(self.keys, prefix) if prefix else 0
+        while i < len(self.keys) and len(found) < limit:
+            key = self.keys[i]
+            if prefix and not key.startswith(prefix):
+                break
+            item_id = int(key.rsplit("\0", 1)[1])
+            if item_id not in seen:
+                seen.add(item_id)
+                found.append(item_id)
+            i += 1
+        return found
+
+
+class MemberIndex:
+    """Miembros (sin bots) y roles de los guilds del bot, buscables por prefijo de nombre.
+
+    Indexa username, display name y cada palabra de ellos. Se reconstruye en on_ready y se
+    mantiene con los eventos de miembros y roles; /api/members sólo consulta memoria.
+    Los eventos que llegan mientras `rebuild()` espera se aplican al índice viejo y se
+    reaplican sobre el nuevo al cambiarlos, así que no se pierden.
+    """
+
+    def __init__(self):
+        self.members = {}  # id -> payload para el dashboard
+        self.member_guilds = {}  # id -> guilds en los que está (se borra al salir del último)
+        self.roles = {}
+        self.member_keys = _PrefixIndex()
+        self.role_keys = _PrefixIndex()
+        self._generation = 0
+        self._replay = {}  # generación de cada rebuild en curso -> eventos (método, objeto)
+
+    def _record(self, method, obj):
+        for events in self._replay.values():
+            events.append((method, obj))
+
+    @staticmethod
+    def _member_payload(member):
+        return {
+            "id": str(member.id),
+            "username": member.name,
+            "display": member.display_name,
+            "avatar": str(member.avatar.url) if member.avatar else None
+        }
+
+    @staticmethod
+    def _role_payload(role):
+        color = f"#{role.color.value:06x}" if role.color.value else "#7289da"
+        return {"id": str(role.id), "name": role.name, "color": color}
+
+    async def rebuild(self, guilds):
+        self._generation += 1
+        generation = self._generation
+        self._replay[generation] = []
+        try:
+            await self._rebuild(guilds, generation)
+        finally:
+            self._replay.pop(generation, None)
+
+    async def _rebuild(self, guilds, generation):
+        members, member_guilds, roles = {}, {}, {}
+        for guild in guilds:
+            for n, member in enumerate(guild.members, 1):
+                if not member.bot:
+                    members[member.id] = self._member_payload(member)
+                    member_guilds.setdefault(member.id, set()).add(guild.id)
+                if n % 5000 == 0:
+                    await asyncio.sleep(0)  # guilds grandes: no acaparar el loop
+            for role in guild.roles:
+                if not role.is_default():
+                    roles[role.id] = self._role_payload(role)
+        # Ordenar cientos de miles de términos no se hace en el loop
+        member_keys, role_keys = _PrefixIndex(), _PrefixIndex()
+        await asyncio.to_thread(member_keys.rebuild, (
+            (mid, _PrefixIndex.terms_for(p["username"], p["display"])) for mid, p in members.items()
+        ))
+        role_keys.rebuild((rid, _PrefixIndex.terms_for(p["name"])) for rid, p in roles.items())
+        if generation != self._generation:
+            return  # empezó otro rebuild con la lista de guilds más nueva; ese hará el cambio
+        self.members, self.member_guilds, self.roles = members, member_guilds, roles
+        self.member_keys, self.role_keys = member_keys, role_keys
+        for method, obj in self._replay.pop(generation):
+            method(obj)
+        logger.info(f">>> [MEMBERS] Índice: {len(members)} miembros, {len(roles)} roles")
+
+    def put_member(self, member):
+        if member.bot or not MEMBERS_CACHED:
+            return
+        self._record(self.put_member, member)
+        payload = self._member_payload(member)
+        guild = getattr(member, 'guild', None)
+        if guild is not None:
+            self.member_guilds.setdefault(member.id, set()).add(guild.id)
+        if self.members.get(member.id) != payload:
+            self.members[member.id] = payload
+            self.member_keys.put(member.id, _PrefixIndex.terms_for(payload["username"], payload["display"]))
+
+    def remove_member(self, member):
+        self._record(self.remove_member, member)
+        guilds = self.member_guilds.get(member.id)
+        if guilds is not None:
+            guilds.discard(member.guild.id)
+            if guilds:
+                return
+            del self.member_guilds[member.id]
+        self.members.pop(member.id, None)
+        self.member_keys.remove(member.id)
+
+    def put_role(self, role):
+        if role.is_default():
+            return
+        self._record(self.put_role, role)
+        self.roles[role.id] = self._role_payload(role)
+        self.role_keys.put(role.id, _PrefixIndex.terms_for(role.name))
+
+    def remove_role(self, role):
+        self._record(self.remove_role, role)
+        self.roles.pop(role.id, None)
+        self.role_keys.remove(role.id)
+
+    def search(self, q, limit=10, role_limit=4):
+        prefix = (q or "").lower().strip()
+        return {
+            "members": [self.members[mid] for mid in self.member_keys.search(prefix, limit)],
+            "roles": [self.roles[rid] for rid in self.role_keys.search(prefix, role_limit)]
+        }
+
+
+member_index = MemberIndex()
+
+@client.event
+async def on_member_join(member):
+    member_index.put_member(member)
+
+@client.event
+async def on_member_update(before, after):
+    member_index.put_member(after)
+
+@client.event
+async def on_member_remove(member):
+    member_index.remove_member(member)
+
+@client.event
+async def on_user_update(before, after):
+    # Cambios de username/avatar globales: llegan una vez por usuario, no por guild
+    for guild in client.guilds:
+        member = guild.get_member(after.id)
+        if member is not None:
+            member_index.put_member(member)
+            break
+
+@client.event
+async def on_guild_role_create(role):
+    member_index.put_role(role)
+
+@client.event
+async def on_guild_role_update(before, after):
+    member_index.put_role(after)
+
+@client.event
+async def on_guild_role_delete(role):
+    discord_resolver.forget("role", role.id)
+    member_index.remove_role(role)
+
+@client.event
+async def on_guild_join(guild):
+    await member_index.rebuild(client.guilds)
+
+@client.event
+async def on_guild_remove(guild):
+    await member_index.rebuild(client.guilds)
 
-    await client.process_commands(message)
 
-# --- RUTAS FLASK API Y DASHBOARD ---
+# --- WEB (aiohttp sobre el loop del bot): API Y DASHBOARD ---
 _MOBILE_UA_RE = re_mod.compile(
     r'(iPhone|iPod|iPad|Android.*Mobile|Mobile.*Android|Windows Phone|IEMobile|Opera Mini|BlackBerry|webOS|Silk)',
     re_mod.IGNORECASE
 )
 
-def _is_mobile_request():
+def _is_mobile_request(request):
     # Query-string override wins over UA sniffing (handy for testing)
-    force = (request.args.get("view") or "").lower()
+    force = (request.query.get("view") or "").lower()
     if force == "mobile":
         return True
     if force == "desktop":
@@ -768,24 +3180,43 @@ def _is_mobile_request():
     ua = request.headers.get("User-Agent", "")
     return bool(_MOBILE_UA_RE.search(ua))
 
-@app.route("/")
-def index():
-    if _is_mobile_request():
-        return render_template("mobile.html")
-    return render_template("index.html")
+async def _await_bot(coro, timeout):
+    """Espera como mucho `timeout` s; si vence, la operación de Discord sigue en segundo plano."""
+    t0 = time_gs.perf_counter()
+    try:
+        return await asyncio.wait_for(asyncio.shield(coro), timeout)
+    except asyncio.TimeoutError:
+        METRIC_BOT_HOP_TIMEOUTS.inc()
+        raise
+    finally:
+        METRIC_BOT_HOP.observe(time_gs.perf_counter() - t0)
+
+async def _json_body(request):
+    try:
+        return await request.json() or {}
+    except Exception:
+        return {}
+
+@routes.get("/")
+async def index(request):
+    if _is_mobile_request(request):
+        return web.FileResponse(os.path.join(TEMPLATES_DIR, "mobile.html"))
+    return web.FileResponse(os.path.join(TEMPLATES_DIR, "index.html"))
+
+def _stored_channels():
+    with db_pool.connection() as conn:
+        return [dict(row) for row in conn.execute("SELECT channel_name as name, channel_id as id FROM channels").fetchall()]
 
-@app.route("/api/channels")
-def get_channels():
+@routes.get("/api/channels")
+async def get_channels(request):
     if not bot_ready_event.is_set():
-        return jsonify({}), 503
+        return web.json_response({}, status=503)
     async def get_channels_async():
         try:
-            category = client.get_channel(TARGET_CATEGORY_ID)
-            if not category:
-                try:
-                    category = await client.fetch_channel(TARGET_CATEGORY_ID)
-                except:
-                    pass
+            try:
+                category = await discord_resolver.channel(TARGET_CATEGORY_ID)
+            except Exception:
+                category = None
             if category:
                 text_channels = [c for c in category.channels if isinstance(c, discord.TextChannel)]
                 text_channels.sort(key=lambda x: x.position)
@@ -795,37 +3226,158 @@ def get_channels():
             return []
             
     try:
-        future = asyncio.run_coroutine_threadsafe(get_channels_async(), client.loop)
-        channels = future.result(timeout=5)
+        channels = await asyncio.wait_for(get_channels_async(), timeout=5)
         if channels:
-            return jsonify(channels)
-            
-        conn = get_db_connection()
-        db_chans = conn.execute("SELECT DISTINCT channel_name as name, channel_id as id FROM messages").fetchall()
-        conn.close()
-        return jsonify([{"id": str(row["id"]), "name": row["name"]} for row in db_chans])
+            return web.json_response(channels)
+
+        db_chans = await run_db(_stored_channels)
+        return web.json_response([{"id": str(row["id"]), "name": row["name"]} for row in db_chans])
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return web.json_response({"error": str(e)}, status=500)
 
-@app.route("/api/botinfo")
-def bot_info():
+@routes.get("/api/botinfo")
+async def bot_info(request):
     try:
         if not bot_ready_event.is_set():
-            return jsonify({"ready": False}), 503
+            return web.json_response({"ready": False}, status=503)
         name = str(client.user.name) if client.user else None
         uid = str(client.user.id) if client.user else None
-        return jsonify({"ready": True, "name": name, "id": uid})
+        return web.json_response({"ready": True, "name": name, "id": uid})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return web.json_response({"error": str(e)}, status=500)
 
-@app.route("/api/messages")
-def get_messages():
+MESSAGE_PAGE_MAX = 200
+
+def _page_limit(limit_q, default):
     try:
-        channel_id = request.args.get("channel_id")
-        limit_q = request.args.get("limit")
-        since_id_q = request.args.get("since_id")
-        conn = get_db_connection()
-        
+        lim = int(limit_q) if limit_q else default
+    except ValueError:
+        lim = default
+    return max(1, min(lim, MESSAGE_PAGE_MAX))
+
+def _query_messages(cid, since_id, limit_q, before_id=None, after_id=None):
+    """(mensajes en orden ascendente, next_cursor).
+
+    Paginación por clave sobre message_id (snowflake, crece con el tiempo) usando
+    idx_messages_channel_msg: la página 500 cuesta lo mismo que la primera. Se pide una
+    fila de más para saber si hay siguiente página; next_cursor es el message_id desde el
+    que seguir (before_id hacia atrás, after_id hacia delante) o None si no queda nada.
+    """
+    next_cursor = None
+    with db_pool.connection() as conn:
+        if since_id is not None and cid is not None:
+            rows = conn.execute("SELECT * FROM messages WHERE channel_id=? AND message_id > ? ORDER BY message_id ASC", (cid, since_id)).fetchall()
+        elif cid is not None and after_id is not None:
+            lim = _page_limit(limit_q, 100)
+            rows = conn.execute("SELECT * FROM messages WHERE channel_id=? AND message_id > ? ORDER BY message_id ASC LIMIT ?", (cid, after_id, lim + 1)).fetchall()
+            if len(rows) > lim:
+                rows = rows[:lim]
+                next_cursor = rows[-1]["message_id"]
+        elif cid is not None:
+            # Sin before_id: la página más reciente; con él, la anterior a ese mensaje
+            lim = _page_limit(limit_q, 100)
+            if before_id is not None:
+                rows = conn.execute("SELECT * FROM messages WHERE channel_id=? AND message_id < ? ORDER BY message_id DESC LIMIT ?", (cid, before_id, lim + 1)).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM messages WHERE channel_id=? ORDER BY message_id DESC LIMIT ?", (cid, lim + 1)).fetchall()
+            if len(rows) > lim:
+                rows = rows[:lim]
+                next_cursor = rows[-1]["message_id"]
+            rows.reverse()
+        else:
+            lim = _page_limit(limit_q, 50)
+            rows = conn.execute("SELECT * FROM messages ORDER BY message_id DESC LIMIT ?", (lim,)).fetchall()
+    return [_message_payload(dict(row)) for row in rows], (str(next_cursor) if next_cursor else None)
+
+# ─── MENCIONES: resolución desde caché con REST concurrente de respaldo ──────
+MENTION_USER_RE = re_mod.compile(r"<@!?(\d+)>")
+MENTION_ROLE_RE = re_mod.compile(r"<@&(\d+)>")
+MENTION_FETCH_MAX = 25  # usuarios como mucho a REST por petición
+MENTION_FETCH_CONCURRENCY = 5
+
+def _mention_ids(messages):
+    users, roles = set(), set()
+    for msg in messages:
+        content = msg.get("content") or ""
+        if "<@" in content:
+            users.update(MENTION_USER_RE.findall(content))
+            roles.update(MENTION_ROLE_RE.findall(content))
+    return users, roles
+
+def _user_mention_payload(user):
+    return {
+        "display": user.display_name,
+        "username": user.name,
+        "avatar": str(user.avatar.url) if user.avatar else None
+    }
+
+async def _resolve_mentions(user_ids, role_ids):
+    """{"users": {id: ...}, "roles": {id: ...}} desde la caché de discord.py; sólo los usuarios
+    que no estén en caché van a REST, en paralelo y acotados."""
+    users, roles, missing = {}, {}, []
+    for uid in user_ids:
+        try:
+            uid_int = int(uid)
+        except (TypeError, ValueError):
+            continue
+        cached = None
+        for guild in client.guilds:
+            cached = guild.get_member(uid_int)
+            if cached:
+                break
+        if cached:
+            users[str(uid)] = _user_mention_payload(cached)
+        else:
+            missing.append(uid_int)
+
+    semaphore = asyncio.Semaphore(MENTION_FETCH_CONCURRENCY)
+    async def fetch_one(uid):
+        async with semaphore:
+            try:
+                user = await discord_resolver.user(uid)
+            except Exception:
+                user = None
+            if user is None:
+                return uid, {"display": f"User_{str(uid)[:4]}", "username": str(uid), "avatar": None}
+            return uid, _user_mention_payload(user)
+    for uid, payload in await asyncio.gather(*(fetch_one(uid) for uid in missing[:MENTION_FETCH_MAX])):
+        users[str(uid)] = payload
+
+    for rid in role_ids:
+        try:
+            role = await discord_resolver.role(rid)
+        except (TypeError, ValueError):
+            continue
+        if role:
+            color = f"#{role.color.value:06x}" if role.color.value else "#7289da"
+            roles[str(rid)] = {"name": role.name, "color": color}
+    return {"users": users, "roles": roles}
+
+def _cached_json_response(request, entry):
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        if "*" in tags or entry.etag in tags:
+            message_cache.stats["not_modified"] += 1
+            return web.Response(status=304, headers=headers)
+    body, encoding = entry.body_for(request.headers.get("Accept-Encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return web.Response(body=body, content_type="application/json", headers=headers)
+
+@routes.get("/api/messages")
+async def get_messages(request):
+    try:
+        channel_id = request.query.get("channel_id")
+        limit_q = request.query.get("limit")
+        since_id_q = request.query.get("since_id")
+        try:
+            before_id = int(request.query["before_id"]) if request.query.get("before_id") else None
+            after_id = int(request.query["after_id"]) if request.query.get("after_id") else None
+        except ValueError:
+            return web.json_response({"error": "before_id/after_id inválido"}, status=400)
+
         cid = None
         if channel_id:
             try:
@@ -839,58 +3391,150 @@ def get_messages():
                 since_id = int(since_id_q)
             except ValueError:
                 pass
-                
-        if since_id is not None and cid is not None:
-            rows = conn.execute("SELECT * FROM messages WHERE channel_id=? AND message_id > ? ORDER BY timestamp ASC", (cid, since_id)).fetchall()
-        elif cid is not None:
-            try:
-                lim = int(limit_q) if limit_q else 100
-            except ValueError:
-                lim = 100
-            rows = conn.execute("SELECT * FROM (SELECT * FROM messages WHERE channel_id=? ORDER BY timestamp DESC LIMIT ?) ORDER BY timestamp ASC", (cid, lim)).fetchall()
-        else:
-            try:
-                lim = int(limit_q) if limit_q else 50
-            except ValueError:
-                lim = 50
-            rows = conn.execute("SELECT * FROM messages ORDER BY timestamp DESC LIMIT ?", (lim,)).fetchall()
-            
-        conn.close()
-        results = []
-        for row in rows:
-            d = dict(row)
-            d['channel_id'] = str(d['channel_id']) if d.get('channel_id') else None
-            d['message_id'] = str(d['message_id']) if d.get('message_id') else None
-            d['author_id'] = str(d['author_id']) if d.get('author_id') else None
-            # Parsear embeds y components de string JSON a objeto
-            for fld in ('embeds', 'components'):
-                raw = d.get(fld)
-                if raw:
-                    try:
-                        d[fld] = json_mod.loads(raw)
-                    except Exception:
-                        d[fld] = None
-                else:
-                    d[fld] = None
-            results.append(d)
-        return jsonify(results)
+
+        with_mentions = request.query.get("mentions") in ("1", "true") and bot_ready_event.is_set()
+        key = (cid, since_id, before_id, after_id, limit_q, with_mentions)
+        entry = message_cache.get(key)
+        if entry is None:
+            # La generación se toma antes de leer: si entra una escritura mientras tanto, la
+            # entrada nace ya caducada en vez de quedarse con datos viejos
+            generation = message_cache.generation(cid)
+            messages, next_cursor = await run_db(_query_messages, cid, since_id, limit_q, before_id, after_id)
+            payload = messages
+            # Con cursores o menciones la respuesta es un objeto; sin ellos, la lista de siempre
+            if with_mentions or before_id is not None or after_id is not None:
+                payload = {"messages": messages, "next_cursor": next_cursor}
+            if with_mentions:
+                # ?mentions=1: los <@id>/<@&id> ya resueltos, sin segunda ida a /api/mention_lookup
+                user_ids, role_ids = _mention_ids(messages)
+                payload["mentions"] = await _await_bot(_resolve_mentions(user_ids, role_ids), timeout=10) if (user_ids or role_ids) else {"users": {}, "roles": {}}
+            newest = max((int(m["message_id"]) for m in messages if m.get("message_id")), default=0)
+            entry = message_cache.put(key, generation, payload, newest,
+                                      ttl=MESSAGE_CACHE_MENTIONS_TTL if with_mentions else None)
+        return _cached_json_response(request, entry)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+# ─── BÚSQUEDA DE TEXTO COMPLETO (FTS5) ──────────────────────────────────────
+SEARCH_PAGE_MAX = 50
+SEARCH_SNIPPET_TOKENS = 16
+
+def _fts_query(q):
+    """Texto libre -> expresión MATCH segura: cada palabra como frase entre comillas (AND
+    implícito) y la última como prefijo, para buscar mientras se escribe."""
+    terms = [t for t in q.split() if re_mod.search(r"\w", t)]
+    if not terms:
+        return None
+    quoted = ['"' + t.replace('"', '""') + '"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def _fts_available():
+    with db_pool.connection() as conn:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE name='messages_fts'").fetchone() is not None
+
+def _search_messages(match, channel_id, author_id, limit, offset, sort):
+    # snippet() marca con \x02/\x03; se escapa el HTML y luego se cambian por <mark>
+    sql = ["""SELECT m.*, snippet(messages_fts, -1, char(2), char(3), '…', ?) AS snippet
+              FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+              WHERE messages_fts MATCH ?"""]
+    params = [SEARCH_SNIPPET_TOKENS, match]
+    if channel_id is not None:
+        sql.append("AND m.channel_id = ?")
+        params.append(channel_id)
+    if author_id is not None:
+        sql.append("AND m.author_id = ?")
+        params.append(author_id)
+    # rank = bm25 (orden por relevancia); recent evita ordenar todas las coincidencias
+    sql.append("ORDER BY messages_fts.rowid DESC" if sort == "recent" else "ORDER BY messages_fts.rank")
+    sql.append("LIMIT ? OFFSET ?")
+    params += [limit + 1, offset]
+    with db_pool.connection() as conn:
+        rows = conn.execute(" ".join(sql), params).fetchall()
+    results = []
+    for row in rows[:limit]:
+        d = dict(row)
+        snippet = html_mod.escape(d.pop("snippet") or "")
+        d = _message_payload(d)
+        d["snippet_html"] = snippet.replace("\x02", "<mark>").replace("\x03", "</mark>")
+        results.append(d)
+    return results, (offset + limit if len(rows) > limit else None)
+
+@routes.get("/api/search")
+async def search_messages(request):
+    q = request.query.get("q", "")
+    match = _fts_query(q)
+    if match is None:
+        return web.json_response({"error": "q vacío"}, status=400)
+    try:
+        channel_id = int(request.query["channel_id"]) if request.query.get("channel_id") else None
+        author_id = int(request.query["author_id"]) if request.query.get("author_id") else None
+        limit = max(1, min(int(request.query.get("limit", 20)), SEARCH_PAGE_MAX))
+        offset = max(0, int(request.query.get("offset", 0)))
+    except ValueError:
+        return web.json_response({"error": "channel_id, author_id, limit y offset deben ser números"}, status=400)
+    sort = "recent" if request.query.get("sort") == "recent" else "rank"
+    try:
+        if not await run_db(_fts_available):
+            return web.json_response({"error": "Búsqueda no disponible (SQLite sin FTS5)"}, status=501)
+        t0 = time_gs.perf_counter()
+        results, next_offset = await run_db(_search_messages, match, channel_id, author_id, limit, offset, sort)
+        return web.json_response({
+            "query": q,
+            "results": results,
+            "next_offset": next_offset,
+            "took_ms": round((time_gs.perf_counter() - t0) * 1000, 2)
+        })
+    except sqlite3.OperationalError as e:
+        return web.json_response({"error": f"Consulta no válida: {e}"}, status=400)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return web.json_response({"error": str(e)}, status=500)
+
+# ─── LIVE STREAM (SSE): new/edit/delete por canal; el polling queda de respaldo ──
+@routes.get("/api/stream")
+async def stream_messages(request):
+    resp = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    await resp.prepare(request)
+    sub = message_broker.subscribe(request.query.get("channel_id"))
+    try:
+        await resp.write(b"retry: 3000\n\n")
+        while True:
+            if sub.overflowed:
+                sub.overflowed = False
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                await resp.write(f"event: resync\ndata: {json_mod.dumps({'channel_id': sub.channel_id})}\n\n".encode())
+            try:
+                event_type, data = await asyncio.wait_for(sub.queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await resp.write(b": keepalive\n\n")
+                continue
+            await resp.write(f"event: {event_type}\ndata: {json_mod.dumps(data)}\n\n".encode())
+    except ConnectionResetError:
+        pass
+    finally:
+        message_broker.unsubscribe(sub)
+    return resp
 
-@app.route("/api/send", methods=['POST'])
-def send_message():
-    data = request.json
+@routes.post("/api/send")
+async def send_message(request):
+    data = await _json_body(request)
     channel_id = data.get("channel_id")
     content = data.get("content")
     if not channel_id or not content:
-        return jsonify({"error": "Faltan datos"}), 400
+        return web.json_response({"error": "Faltan datos"}, status=400)
     if not bot_ready_event.is_set():
-        return jsonify({"error": "Bot desconectado"}), 503
+        return web.json_response({"error": "Bot desconectado"}, status=503)
         
     async def send_async():
         try:
-            c_id = int(channel_id)
-            channel = await client.fetch_channel(c_id)
+            channel = await discord_resolver.channel(channel_id)
+            if channel is None:
+                return {"success": False, "error": "Canal no encontrado"}
             sent = await channel.send(content)
             # Bot messages are skipped by on_message (author.bot check),
             # so we must manually save them to the DB here.
@@ -907,44 +3551,41 @@ def send_message():
         except Exception as e:
             return {"success": False, "error": str(e)}
             
-    future = asyncio.run_coroutine_threadsafe(send_async(), client.loop)
     try:
-        result = future.result(timeout=10)
-        return jsonify(result)
+        result = await _await_bot(send_async(), timeout=10)
+        return web.json_response(result)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return web.json_response({"error": str(e)}, status=500)
 
 
 # -- NUEVO: ENDPOINT DEADLINE DESDE WEB --
-@app.route("/api/deadline", methods=["POST"])
-def api_deadline():
-    data = request.json or {}
+@routes.post("/api/deadline")
+async def api_deadline(request):
+    data = await _json_body(request)
     target_id  = data.get("target_id")
     channel_id = data.get("channel_id")
 
     if not target_id or not channel_id:
-        return jsonify({"error": "Faltan parámetros"}), 400
+        return web.json_response({"error": "Faltan parámetros"}, status=400)
     if not bot_ready_event.is_set():
-        return jsonify({"error": "Bot no listo"}), 503
+        return web.json_response({"error": "Bot no listo"}, status=503)
 
     async def trigger_deadline():
         try:
-            channel = client.get_channel(int(channel_id))
-            if not channel:
-                try:
-                    channel = await client.fetch_channel(int(channel_id))
-                except discord.NotFound:
-                    return {"error": "Canal no encontrado"}
-                except discord.Forbidden:
-                    return {"error": "Sin permiso para acceder al canal"}
+            try:
+                channel = await discord_resolver.channel(channel_id)
+            except discord.Forbidden:
+                return {"error": "Sin permiso para acceder al canal"}
+            if channel is None:
+                return {"error": "Canal no encontrado"}
 
-            deadline_dt = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=24)
+            deadline_dt = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=DEADLINE_SECONDS)
             unix_ts     = int(deadline_dt.timestamp())
 
             # Intentar obtener el nombre del usuario para el embed
             try:
-                target_user = await client.fetch_user(int(target_id))
-                mention_str = target_user.mention
+                target_user = await discord_resolver.user(target_id)
+                mention_str = target_user.mention if target_user else f"<@{target_id}>"
             except Exception:
                 mention_str = f"<@{target_id}>"
 
@@ -959,186 +3600,599 @@ def api_deadline():
             embed.set_footer(text="BLZ-T · Web Panel")
             try:
                 sent = await channel.send(embed=embed)
-                await sent.add_reaction("✅")
+                await sent.add_reaction(DEADLINE_EMOJI)
             except discord.Forbidden:
                 return {"error": "Sin permiso para enviar mensajes en ese canal"}
             except Exception as e:
                 return {"error": f"{type(e).__name__}: {e}"}
+            await deadline_scheduler.add(sent, target_id)
             logger.info(f">>> [DEADLINE WEB] Sent for user {target_id} in channel {channel_id}")
 
-            # Watcher igual que el slash command
-            async def watch():
-                try:
-                    def check(reaction, u):
-                        return (str(reaction.emoji) == '✅'
-                                and reaction.message.id == sent.id
-                                and str(u.id) == str(target_id)
-                                and not u.bot)
-                    await client.wait_for('reaction_add', check=check, timeout=86400)
-                    confirmed = discord.Embed(
-                        title="Confirmed",
-                        description=f"{mention_str} has confirmed their availability.",
-                        color=0x26C9B8
-                    )
-                    await sent.edit(embed=confirmed)
-                    await sent.clear_reactions()
-                    logger.info(f">>> [DEADLINE WEB] Confirmed by {target_id}")
-                except asyncio.TimeoutError:
-                    close_embed = discord.Embed(
-                        title="Ticket Ready to Close",
-                        description=f"{mention_str} did not confirm within 24h.",
-                        color=0xFF6B6B
-                    )
-                    await channel.send(embed=close_embed)
-                    expired = discord.Embed(
-                        title="Deadline Expired",
-                        description=f"{mention_str} did not respond.",
-                        color=0x888888
-                    )
-                    await sent.edit(embed=expired)
-                    await sent.clear_reactions()
-                except Exception as e:
-                    logger.error(f"!!! [DEADLINE WEB WATCH]: {e}")
-
-            asyncio.create_task(watch())
             return {"success": True, "status": "Deadline enviado"}
         except Exception as e:
             logger.error(f"!!! [API DEADLINE ERROR]: {e}")
             return {"error": str(e)}
 
     try:
-        future = asyncio.run_coroutine_threadsafe(trigger_deadline(), client.loop)
-        result = future.result(timeout=15)
+        result = await _await_bot(trigger_deadline(), timeout=15)
         if result.get("error"):
-            return jsonify(result), 500
-        return jsonify(result)
+            return web.json_response(result, status=500)
+        return web.json_response(result)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return web.json_response({"error": str(e)}, status=500)
 
 # ─── MENCIONES: lookup de usuarios/roles ─────────────────────────────────────
-@app.route("/api/mention_lookup", methods=["POST"])
-def mention_lookup():
-    data = request.json or {}
+@routes.post("/api/mention_lookup")
+async def mention_lookup(request):
+    data = await _json_body(request)
     user_ids = data.get("users", [])
     role_ids = data.get("roles", [])
     if not bot_ready_event.is_set():
-        return jsonify({"users": {}, "roles": {}})
-
-    async def lookup_async():
-        users, roles = {}, {}
-        for uid in user_ids[:20]:
-            try:
-                user = await client.fetch_user(int(uid))
-                users[str(uid)] = {
-                    "display": user.display_name,
-                    "username": user.name,
-                    "avatar": str(user.avatar.url) if user.avatar else None
-                }
-            except Exception:
-                users[str(uid)] = {"display": f"User_{str(uid)[:4]}", "username": str(uid), "avatar": None}
-        for guild in client.guilds:
-            for rid in role_ids[:20]:
-                try:
-                    role = guild.get_role(int(rid))
-                    if role:
-                        color = f"#{role.color.value:06x}" if role.color.value else "#7289da"
-                        roles[str(rid)] = {"name": role.name, "color": color}
-                except Exception:
-                    pass
-        return users, roles
+        return web.json_response({"users": {}, "roles": {}})
 
     try:
-        future = asyncio.run_coroutine_threadsafe(lookup_async(), client.loop)
-        u, r = future.result(timeout=10)
-        return jsonify({"users": u, "roles": r})
+        result = await _await_bot(_resolve_mentions(user_ids[:20], role_ids[:20]), timeout=10)
+        return web.json_response(result)
     except Exception as e:
         logger.error(f"!!! [MENTION LOOKUP]: {e}")
-        return jsonify({"users": {}, "roles": {}}), 500
+        return web.json_response({"users": {}, "roles": {}}, status=500)
 
 # ─── MIEMBROS Y ROLES para autocompletado ────────────────────────────────────
-@app.route("/api/members")
-def get_members():
-    if not bot_ready_event.is_set():
-        return jsonify({"members": [], "roles": []}), 503
-
-    async def fetch_async():
-        members_list, roles_list, seen = [], [], set()
-        for guild in client.guilds:
-            for member in guild.members:
-                if not member.bot and str(member.id) not in seen:
-                    seen.add(str(member.id))
-                    members_list.append({
-                        "id": str(member.id),
-                        "username": member.name,
-                        "display": member.display_name,
-                        "avatar": str(member.avatar.url) if member.avatar else None
-                    })
-            for role in guild.roles:
-                if role.name != "@everyone":
-                    color = f"#{role.color.value:06x}" if role.color.value else "#7289da"
-                    roles_list.append({"id": str(role.id), "name": role.name, "color": color})
-        return {"members": members_list[:300], "roles": roles_list[:50]}
+async def _query_members_remote(q, limit):
+    found, seen = [], set()
+    for guild in client.guilds:
+        try:
+            members = await guild.query_members(query=q, limit=min(100, limit * 2), cache=False)
+        except (asyncio.TimeoutError, discord.ClientException) as e:
+            logger.error(f"!!! [MEMBERS QUERY] guild {guild.id}: {e}")
+            continue
+        for member in members:
+            if not member.bot and member.id not in seen:
+                seen.add(member.id)
+                found.append(MemberIndex._member_payload(member))
+    found.sort(key=lambda p: (p["display"].lower(), p["id"]))
+    return found[:limit]
 
+@routes.get("/api/members")
+async def get_members(request):
+    if not bot_ready_event.is_set():
+        return web.json_response({"members": [], "roles": []}, status=503)
     try:
-        future = asyncio.run_coroutine_threadsafe(fetch_async(), client.loop)
-        return jsonify(future.result(timeout=8))
+        # Sin q se mantiene el listado acotado de antes (300 miembros / 50 roles), ya ordenado
+        q = request.query.get("q")
+        default_limit = "10" if q is not None else "300"
+        limit = max(1, min(int(request.query.get("limit", default_limit)), 300 if q is None else MEMBER_SEARCH_MAX))
+        role_limit = max(0, min(int(request.query.get("role_limit", "4" if q is not None else "50")), 50))
+    except ValueError:
+        return web.json_response({"error": "limit inválido"}, status=400)
+    try:
+        result = member_index.search(q, limit, role_limit)
+        if not MEMBERS_CACHED:
+            # Sin lista de miembros en memoria: búsqueda por prefijo en el gateway (op 8),
+            # que no admite consulta vacía
+            q = (q or "").strip()
+            result["members"] = await _await_bot(_query_members_remote(q, limit), timeout=8) if q else []
+        return web.json_response(result)
     except Exception as e:
         logger.error(f"!!! [MEMBERS ERROR]: {e}")
-        return jsonify({"error": str(e)}), 500
+        return web.json_response({"error": str(e)}, status=500)
+
+# ─── LOGS: tail desde el final + cursor ?after=<offset> + stream SSE ──────────
+LOG_TAIL_BLOCK = 64 * 1024
+LOG_READ_MAX = 512 * 1024  # máximo de bytes nuevos por respuesta; el resto llega en la siguiente
+
+def _log_tail(path, lines):
+    """Últimas `lines` líneas leyendo bloques hacia atrás; devuelve (texto, offset, inode)."""
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        pos = end = st.st_size
+        buf = b""
+        while pos > 0 and buf.count(b"\n") <= lines:
+            step = min(LOG_TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+    text = b"".join(buf.splitlines(keepends=True)[-lines:]).decode('utf-8', errors='replace')
+    return text, end, st.st_ino
 
-# ─── LOGS: endpoint mejorado con filtro de líneas ────────────────────────────
-@app.route("/api/logs")
-def api_logs():
+def _log_read_range(path, offset):
+    # Sólo líneas completas: una línea a medio escribir se entrega en la siguiente lectura
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(LOG_READ_MAX)
+    cut = data.rfind(b"\n") + 1
+    return data[:cut], offset + cut, len(data) == LOG_READ_MAX
+
+def _log_read_after(path, offset, inode):
+    """Bytes añadidos desde (inode, offset): (texto, offset, inode) o None si hay que recargar.
+
+    Si bot.log rotó desde la última lectura, se termina el archivo rotado (bot.log.1) y se
+    sigue por el nuevo desde 0. Si el cursor ya no corresponde a ningún archivo (rotaron
+    varios, o se truncó), devuelve None.
+    """
+    st = os.stat(path)
+    if inode and inode != st.st_ino:
+        rotated = f"{path}.1"
+        try:
+            rst = os.stat(rotated)
+        except FileNotFoundError:
+            return None
+        if rst.st_ino != inode or offset > rst.st_size:
+            return None
+        head, new_offset, more = _log_read_range(rotated, offset)
+        if more:
+            return head.decode('utf-8', errors='replace'), new_offset, inode
+        if new_offset < rst.st_size:  # cola sin salto de línea en el rotado: se entrega tal cual
+            with open(rotated, 'rb') as f:
+                f.seek(new_offset)
+                head += f.read()
+        tail, new_offset, _ = _log_read_range(path, 0)
+        return (head + tail).decode('utf-8', errors='replace'), new_offset, st.st_ino
+    if offset > st.st_size:
+        return None
+    data, new_offset, _ = _log_read_range(path, offset)
+    return data.decode('utf-8', errors='replace'), new_offset, st.st_ino
+
+def _log_lines_param(request):
     try:
-        lines_param = request.args.get("lines", "200")
-        lines = min(int(lines_param), 2000)
+        return max(1, min(int(request.query.get("lines", "200")), 2000))
     except (ValueError, TypeError):
-        lines = 200
+        return 200
+
+def _log_cursor(value):
+    # "inode:offset" (Last-Event-ID del stream) o sólo offset
+    try:
+        if ":" in value:
+            inode, offset = value.split(":", 1)
+            return int(inode), int(offset)
+        return 0, int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+class _LogBrokerHandler(logging.Handler):
+    """Avisa a los streams de /api/logs/stream cada vez que se escribe un registro.
+
+    Corre en el hilo del QueueListener detrás del RotatingFileHandler, así que cuando llega
+    el aviso la línea ya está en disco; el stream la lee con el mismo cursor que ?after.
+    """
+
+    def emit(self, record):
+        log_broker.publish("log", "append", None)
+
+
+log_broker = MessageBroker()
+log_listener.add_handler(_LogBrokerHandler())
+
+@routes.get("/api/logs")
+async def api_logs(request):
+    lines = _log_lines_param(request)
     try:
         if not os.path.exists(log_file):
-            return "No log file found", 404
-        with open(log_file, 'r', encoding='utf-8', errors='replace') as f:
-            all_lines = f.readlines()
-        return "".join(all_lines[-lines:])
+            return web.Response(text="No log file found", status=404)
+        after_q = request.query.get("after")
+        result = None
+        reset = True
+        if after_q is not None:
+            cursor = _log_cursor(after_q)
+            if cursor is not None:
+                inode = int(request.query.get("inode", cursor[0]) or 0)
+                result = await asyncio.to_thread(_log_read_after, log_file, cursor[1], inode)
+                reset = result is None
+        if result is None:
+            result = await asyncio.to_thread(_log_tail, log_file, lines)
+        text, offset, inode = result
+        return web.Response(text=text, headers={
+            "X-Log-Offset": str(offset),
+            "X-Log-Inode": str(inode),
+            "X-Log-Reset": "1" if reset else "0",
+            "Cache-Control": "no-store"
+        })
+    except Exception as e:
+        return web.Response(text=str(e), status=500)
+
+@routes.get("/api/logs/stream")
+async def api_logs_stream(request):
+    if not os.path.exists(log_file):
+        return web.Response(text="No log file found", status=404)
+    resp = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    await resp.prepare(request)
+    sub = log_broker.subscribe("log")
+    lines = _log_lines_param(request)
+    # EventSource reenvía el último id al reconectar: se reanuda sin perder ni repetir líneas
+    cursor = _log_cursor(request.headers.get("Last-Event-ID", ""))
+    try:
+        await resp.write(b"retry: 3000\n\n")
+        result = None
+        if cursor is not None:
+            result = await asyncio.to_thread(_log_read_after, log_file, cursor[1], cursor[0])
+        reset = result is None
+        if reset:
+            result = await asyncio.to_thread(_log_tail, log_file, lines)
+        while True:
+            text, offset, inode = result
+            if text or reset:
+                payload = json_mod.dumps({"text": text, "reset": reset})
+                await resp.write(f"id: {inode}:{offset}\nevent: log\ndata: {payload}\n\n".encode())
+            sub.overflowed = False
+            try:
+                await asyncio.wait_for(sub.queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await resp.write(b": keepalive\n\n")
+            # Una ráfaga de registros se lee de una vez
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            result = await asyncio.to_thread(_log_read_after, log_file, offset, inode)
+            reset = result is None
+            if reset:
+                result = await asyncio.to_thread(_log_tail, log_file, lines)
+    except ConnectionResetError:
+        pass
+    finally:
+        log_broker.unsubscribe(sub)
+    return resp
+
+# ─── LOGS: búsqueda indexada en bot.log y sus rotados ───────────────────────
+LOG_LINE_RE = re_mod.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}):\d{2},\d{3} \[([A-Z]+)\] (?:>>> |!!! )?(?:\[([^\]]{1,40})\])?")
+LOG_SEARCH_MAX = 1000
+
+
+class LogIndex:
+    """Índice por archivo de log (clave: inode, así sobrevive a la rotación).
+
+    Para cada (nivel, tag) guarda los bloques de bytes donde aparece, cada uno con su
+    minuto: líneas consecutivas del mismo minuto se fusionan en un bloque. El rango de
+    tiempo se resuelve con bisect sobre los minutos. `refresh()` sólo parsea lo escrito
+    desde la última vez, y una búsqueda lee del disco únicamente los bloques que encajan.
+    Las líneas sin cabecera (tracebacks) cuentan como parte de la línea anterior.
+
+    Al arrancar se indexa en un hilo aparte (`warm()`) y después el QueueListener lo
+    alimenta registro a registro, así que una búsqueda no parsea los rotados en frío.
+    """
+
+    def __init__(self, path, backups=3):
+        self.paths = [path] + [f"{path}.{n}" for n in range(1, backups + 1)]  # del actual al más viejo
+        self.files = {}  # inode -> {"path", "inode", "indexed", "groups", "key"}
+        self.ready = False  # True tras el primer refresh completo
+        self._lock = threading.Lock()
+
+    def _index_file(self, entry):
+        with open(entry["path"], 'rb') as f:
+            if os.fstat(f.fileno()).st_ino != entry["inode"]:
+                return  # rotó entre stat y open; se reintenta en el siguiente refresh
+            f.seek(entry["indexed"])
+            data = f.read()
+        cut = data.rfind(b"\n") + 1
+        pos = entry["indexed"]
+        groups = entry["groups"]
+        key = entry["key"]  # (minuto, nivel, tag) de la última cabecera vista
+        for raw in data[:cut].splitlines(keepends=True):
+            m = LOG_LINE_RE.match(raw.decode('utf-8', errors='replace'))
+            if m:
+                key = (m.group(1), m.group(2), (m.group(3) or "").upper())
+            if key is not None:
+                minutes, spans = groups.setdefault(key[1:], ([], []))
+                if spans and spans[-1][1] == pos and minutes[-1] == key[0]:
+                    spans[-1][1] = pos + len(raw)
+                else:
+                    minutes.append(key[0])
+                    spans.append([pos, pos + len(raw)])
+            pos += len(raw)
+        entry["indexed"] = pos
+        entry["key"] = key
+
+    def refresh(self, blocking=True):
+        if not self._lock.acquire(blocking=blocking):
+            return  # otro hilo está indexando; lo nuevo se recoge en el siguiente refresh
+        try:
+            seen = set()
+            for path in self.paths:
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entry = self.files.get(st.st_ino)
+                if entry is None or st.st_size < entry["indexed"]:
+                    entry = {"inode": st.st_ino, "indexed": 0, "groups": {}, "key": None}
+                    self.files[st.st_ino] = entry
+                entry["path"] = path
+                seen.add(st.st_ino)
+                if st.st_size > entry["indexed"]:
+                    self._index_file(entry)
+            for inode in [i for i in self.files if i not in seen]:
+                del self.files[inode]
+            self.ready = True
+        finally:
+            self._lock.release()
+
+    def warm(self):
+        threading.Thread(target=self.refresh, name="log-index-warm", daemon=True).start()
+
+    def search(self, levels=None, tag=None, text=None, since=None, until=None, limit=200):
+        """Las `limit` líneas más recientes que cumplen los filtros, en orden cronológico."""
+        self.refresh()
+        since_min = since[:16] if since else None
+        until_min = until[:16] if until else None
+        with self._lock:
+            plan = []
+            for entry in sorted(self.files.values(), key=lambda e: self.paths.index(e["path"])):
+                ranges = []
+                for (level, ktag), (minutes, spans) in entry["groups"].items():
+                    if levels and level not in levels:
+                        continue
+                    if tag and ktag != tag and not ktag.startswith(tag + " "):
+                        continue
+                    lo = bisect.bisect_left(minutes, since_min) if since_min else 0
+                    hi = bisect.bisect_right(minutes, until_min) if until_min else len(minutes)
+                    ranges.extend(span[:] for span in spans[lo:hi])
+                if ranges:
+                    plan.append((entry["path"], entry["inode"], ranges))
+        text = text.lower() if text else None
+        results, scanned = [], 0
+        for path, inode, ranges in plan:
+            # Rangos contiguos se leen juntos (hasta LOG_TAIL_BLOCK), del más reciente al más viejo
+            ranges.sort()
+            reads = [ranges[0]]
+            for start, end in ranges[1:]:
+                if start == reads[-1][1] and end - reads[-1][0] <= LOG_TAIL_BLOCK:
+                    reads[-1][1] = end
+                else:
+                    reads.append([start, end])
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with f:
+                if os.fstat(f.fileno()).st_ino != inode:
+                    continue
+                for start, end in reversed(reads):
+                    scanned += 1
+                    f.seek(start)
+                    found, key, ts = [], None, None
+                    for line in f.read(end - start).decode('utf-8', errors='replace').splitlines():
+                        m = LOG_LINE_RE.match(line)
+                        if m:
+                            key, ts = (m.group(1), m.group(2), (m.group(3) or "").upper()), line[:19]
+                        if key is None or (since and ts < since) or (until and ts > until):
+                            continue
+                        if text and text not in line.lower():
+                            continue
+                        found.append({"file": os.path.basename(path), "time": ts, "level": key[1],
+                                      "tag": key[2], "line": line})
+                    results.extend(reversed(found))
+                    if len(results) >= limit:
+                        results = results[:limit]
+                        results.reverse()
+                        return results, scanned, True
+        results.reverse()
+        return results, scanned, False
+
+    def stats(self):
+        return {"files": len(self.files), "blocks": sum(len(spans) for e in self.files.values() for _, spans in e["groups"].values())}
+
+
+log_index = LogIndex(log_file)
+
+
+class _LogIndexHandler(logging.Handler):
+    """Indexa lo recién escrito en bot.log desde el hilo del QueueListener.
+
+    Va detrás del RotatingFileHandler, así que la línea ya está en disco. Hasta que `warm()`
+    termina no hace nada (el primer refresh es el caro) y nunca espera al lock de una búsqueda.
+    """
+
+    def emit(self, record):
+        if log_index.ready:
+            try:
+                log_index.refresh(blocking=False)
+            except Exception:
+                self.handleError(record)
+
+
+log_listener.add_handler(_LogIndexHandler())
+
+def _log_time_param(value):
+    # Unix timestamp o fecha ISO ("2026-01-31T14:05[:00]"); se compara en hora local como asctime
+    if not value:
+        return None
+    try:
+        dt = datetime.datetime.fromtimestamp(float(value))
+    except ValueError:
+        dt = datetime.datetime.fromisoformat(value)
+        if dt.tzinfo is not None:
+            dt = dt.astimezone().replace(tzinfo=None)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+@routes.get("/api/logs/search")
+async def api_logs_search(request):
+    q = request.query
+    try:
+        levels = {lv.strip().upper() for lv in q.get("level", "").split(",") if lv.strip()} or None
+        tag = q.get("tag", "").strip().strip("[]").upper() or None
+        since = _log_time_param(q.get("since"))
+        until = _log_time_param(q.get("until"))
+        limit = max(1, min(int(q.get("limit", "200")), LOG_SEARCH_MAX))
+    except (ValueError, TypeError, OverflowError) as e:
+        return web.json_response({"error": f"Parámetros inválidos: {e}"}, status=400)
+    try:
+        t0 = time_gs.perf_counter()
+        results, scanned, truncated = await asyncio.to_thread(
+            log_index.search, levels, tag, q.get("q"), since, until, limit
+        )
+        return web.json_response({
+            "results": results,
+            "truncated": truncated,
+            "scanned_blocks": scanned,
+            "took_ms": round((time_gs.perf_counter() - t0) * 1000, 2)
+        })
     except Exception as e:
-        return str(e), 500
+        return web.json_response({"error": str(e)}, status=500)
 
 # ─── STATS BÁSICAS ─────────────────────────────────────────────────────────
-@app.route("/api/stats")
-def api_stats():
+def _count_stored_messages():
+    with db_pool.connection() as conn:
+        return conn.execute("SELECT IFNULL(SUM(message_count), 0) FROM channels").fetchone()[0]
+
+@routes.get("/api/stats")
+async def api_stats(request):
     try:
-        conn = get_db_connection()
-        total_msgs = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
-        conn.close()
-        return jsonify({
-            "total_messages": total_msgs
+        total_msgs = await run_db(_count_stored_messages)
+        return web.json_response({
+            "total_messages": total_msgs,
+            "ingest": message_ingestor.metrics(),
+            "ep_ledger": ep_reconciler.stats,
+            "open_tickets": len(ticket_index.by_channel),
+            "deadlines": {"open": len(deadline_scheduler.open), **deadline_scheduler.stats},
+            "thping": {"scheduled": len(thping_scheduler.entries), **thping_scheduler.stats},
+            "log_index": log_index.stats(),
+            "resolver": discord_resolver.metrics(),
+            "message_cache": message_cache.metrics(),
+            "ticket_archive": ticket_archiver.metrics(),
+            "logging": {
+                "queued": log_queue.qsize(),
+                "queue_max": LOG_QUEUE_MAX,
+                "dropped": dict(log_queue_handler.dropped)
+            },
+            "stream": {
+                "subscribers": message_broker.subscriber_count(),
+                "published": message_broker.published,
+                "dropped": message_broker.dropped
+            }
         })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return web.json_response({"error": str(e)}, status=500)
+
+# ─── /metrics (Prometheus) ───────────────────────────────────────────────────
+def _db_file_sizes():
+    sizes = {}
+    for label, path in (("db", DB_PATH), ("wal", DB_PATH + "-wal")):
+        try:
+            sizes[(label,)] = os.path.getsize(path)
+        except OSError:
+            pass
+    return sizes
+
+metrics.callback("blz_gateway_latency_seconds", "Latencia del heartbeat del gateway", "gauge",
+                 lambda: client.latency if bot_ready_event.is_set() else None)
+metrics.callback("blz_db_size_bytes", "Tamaño de la BD SQLite y su WAL", "gauge", _db_file_sizes, ("file",))
+metrics.callback("blz_deadlines_open", "Deadlines esperando confirmación", "gauge", lambda: len(deadline_scheduler.open))
+metrics.callback("blz_open_tickets", "Tickets abiertos", "gauge", lambda: len(ticket_index.by_channel))
+metrics.callback("blz_thping_scheduled", "Pings recurrentes programados", "gauge", lambda: len(thping_scheduler.entries))
+metrics.callback("blz_ingest_queue_depth", "Filas esperando al writer de SQLite", "gauge", lambda: message_ingestor.metrics()["depth"])
+metrics.callback("blz_ingest_rows_total", "Filas de messages escritas/perdidas por el writer", "counter",
+                 lambda: {("written",): message_ingestor.metrics()["written"], ("failed",): message_ingestor.metrics()["failed"]}, ("result",))
+metrics.callback("blz_sheets_retries_total", "Reintentos contra la API de Sheets", "counter", lambda: sheets_transport.stats["retries"])
+metrics.callback("blz_stream_subscribers", "Clientes SSE conectados", "gauge", lambda: message_broker.subscriber_count())
+metrics.callback("blz_log_dropped_total", "Líneas de log descartadas con la cola llena", "counter",
+                 lambda: {(level,): n for level, n in log_queue_handler.dropped.items()}, ("level",))
+
+@routes.get("/metrics")
+async def prometheus_metrics(request):
+    return web.Response(body=metrics.render().encode(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+# ─── TICKETS: historial de aperturas/cierres ─────────────────────────────────
+def _query_tickets(owner_id, status, limit):
+    sql = "SELECT * FROM tickets"
+    where, params = [], []
+    if owner_id is not None:
+        where.append("owner_id=?")
+        params.append(owner_id)
+    if status:
+        where.append("status=?")
+        params.append(status)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY opened_at DESC LIMIT ?"
+    params.append(limit)
+    with db_pool.connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [{**dict(row), "channel_id": str(row["channel_id"]), "owner_id": str(row["owner_id"]),
+             "guild_id": str(row["guild_id"]) if row["guild_id"] else None,
+             "closed_by": str(row["closed_by"]) if row["closed_by"] else None} for row in rows]
+
+@routes.get("/api/tickets")
+async def api_tickets(request):
+    try:
+        owner_q = request.query.get("owner_id")
+        owner_id = int(owner_q) if owner_q else None
+        limit = max(1, min(int(request.query.get("limit", "100")), 500))
+    except ValueError:
+        return web.json_response({"error": "owner_id/limit inválidos"}, status=400)
+    try:
+        return web.json_response(await run_db(_query_tickets, owner_id, request.query.get("status"), limit))
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+TRANSCRIPT_CHUNK = 64 * 1024
+
+@routes.get("/api/tickets/{channel_id}/transcript")
+async def api_ticket_transcript(request):
+    """Transcripción archivada (JSONL, un mensaje por línea). Se sirve tal cual está en disco
+    si el cliente acepta gzip; ?download=1 la devuelve como fichero .jsonl.gz."""
+    try:
+        channel_id = int(request.match_info["channel_id"])
+    except ValueError:
+        return web.json_response({"error": "channel_id inválido"}, status=400)
+    download = request.query.get("download") in ("1", "true")
+    passthrough = download or "gzip" in request.headers.get("Accept-Encoding", "").lower()
+    path = _ticket_archive_path(channel_id)
+    try:
+        # Por trozos en un hilo: una transcripción grande no se carga entera en memoria
+        fh = await asyncio.to_thread(open if passthrough else gzip.open, path, "rb")
+    except FileNotFoundError:
+        return web.json_response({"error": "Ticket sin transcripción archivada"}, status=404)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+    try:
+        if download:
+            resp = web.StreamResponse(headers={
+                "Content-Type": "application/gzip",
+                "Content-Disposition": f'attachment; filename="ticket-{channel_id}.jsonl.gz"'
+            })
+        else:
+            resp = web.StreamResponse(headers={"Content-Type": "application/x-ndjson; charset=utf-8"})
+            if passthrough:
+                resp.headers["Content-Encoding"] = "gzip"
+        await resp.prepare(request)
+        while True:
+            chunk = await asyncio.to_thread(fh.read, TRANSCRIPT_CHUNK)
+            if not chunk:
+                break
+            await resp.write(chunk)
+        await resp.write_eof()
+        return resp
+    finally:
+        await asyncio.to_thread(fh.close)
 
 # ─── BORRAR MENSAJE ──────────────────────────────────────────────────────────
-@app.route("/api/delete", methods=["POST"])
-def delete_message():
-    data = request.json or {}
+@routes.post("/api/delete")
+async def delete_message(request):
+    data = await _json_body(request)
     channel_id = data.get("channel_id")
     message_id = data.get("message_id")
     if not channel_id or not message_id:
-        return jsonify({"error": "Faltan channel_id y message_id"}), 400
+        return web.json_response({"error": "Faltan channel_id y message_id"}, status=400)
     if not bot_ready_event.is_set():
-        return jsonify({"error": "Bot no listo"}), 503
+        return web.json_response({"error": "Bot no listo"}, status=503)
 
     async def do_delete():
         try:
-            channel = client.get_channel(int(channel_id))
-            if not channel:
-                channel = await client.fetch_channel(int(channel_id))
-            msg = await channel.fetch_message(int(message_id))
+            channel = await discord_resolver.channel(channel_id)
+            msg = channel and await discord_resolver.message(channel, message_id)
+            if msg is None:
+                return {"error": "Mensaje no encontrado"}
             await msg.delete()
+            discord_resolver.forget("message", message_id)
             # Borrar de la base de datos también
-            conn = get_db_connection()
-            conn.execute("DELETE FROM messages WHERE message_id=?", (str(message_id),))
-            conn.commit()
-            conn.close()
+            await message_ingestor.run(_delete_stored_messages, [int(message_id)])
+            # Si el evento del gateway llega después verá rowcount 0 y no invalidará
+            message_cache.invalidate([channel.id])
+            message_broker.publish(channel.id, "delete", {"message_id": str(message_id)})
             return {"success": True}
         except discord.NotFound:
             return {"error": "Mensaje no encontrado"}
@@ -1148,37 +4202,35 @@ def delete_message():
             return {"error": str(e)}
 
     try:
-        future = asyncio.run_coroutine_threadsafe(do_delete(), client.loop)
-        return jsonify(future.result(timeout=10))
+        return web.json_response(await _await_bot(do_delete(), timeout=10))
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return web.json_response({"error": str(e)}, status=500)
 
 
 # ─── EDITAR MENSAJE ──────────────────────────────────────────────────────────
-@app.route("/api/edit", methods=["POST"])
-def edit_message():
-    data = request.json or {}
+@routes.post("/api/edit")
+async def edit_message(request):
+    data = await _json_body(request)
     channel_id  = data.get("channel_id")
     message_id  = data.get("message_id")
     new_content = data.get("content", "").strip()
     if not channel_id or not message_id or not new_content:
-        return jsonify({"error": "Faltan channel_id, message_id o content"}), 400
+        return web.json_response({"error": "Faltan channel_id, message_id o content"}, status=400)
     if not bot_ready_event.is_set():
-        return jsonify({"error": "Bot no listo"}), 503
+        return web.json_response({"error": "Bot no listo"}, status=503)
 
     async def do_edit():
         try:
-            channel = client.get_channel(int(channel_id))
-            if not channel:
-                channel = await client.fetch_channel(int(channel_id))
-            msg = await channel.fetch_message(int(message_id))
+            channel = await discord_resolver.channel(channel_id)
+            msg = channel and await discord_resolver.message(channel, message_id)
+            if msg is None:
+                return {"error": "Mensaje no encontrado"}
             await msg.edit(content=new_content)
+            discord_resolver.forget("message", message_id)
             # Actualizar en base de datos
-            conn = get_db_connection()
-            conn.execute("UPDATE messages SET content=? WHERE message_id=?",
-                         (new_content, str(message_id)))
-            conn.commit()
-            conn.close()
+            await message_ingestor.run(_apply_message_edit, int(message_id), new_content, None)
+            message_cache.invalidate([channel.id])
+            message_broker.publish(channel.id, "edit", {"message_id": str(message_id), "content": new_content})
             return {"success": True}
         except discord.NotFound:
             return {"error": "Mensaje no encontrado"}
@@ -1188,30 +4240,29 @@ def edit_message():
             return {"error": str(e)}
 
     try:
-        future = asyncio.run_coroutine_threadsafe(do_edit(), client.loop)
-        return jsonify(future.result(timeout=10))
+        return web.json_response(await _await_bot(do_edit(), timeout=10))
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return web.json_response({"error": str(e)}, status=500)
 
 
 # ─── REACCIONAR A MENSAJE ────────────────────────────────────────────────────
-@app.route("/api/react", methods=["POST"])
-def react_message():
-    data = request.json or {}
+@routes.post("/api/react")
+async def react_message(request):
+    data = await _json_body(request)
     channel_id = data.get("channel_id")
     message_id = data.get("message_id")
     emoji      = data.get("emoji", "👍")
     if not channel_id or not message_id:
-        return jsonify({"error": "Faltan channel_id y message_id"}), 400
+        return web.json_response({"error": "Faltan channel_id y message_id"}, status=400)
     if not bot_ready_event.is_set():
-        return jsonify({"error": "Bot no listo"}), 503
+        return web.json_response({"error": "Bot no listo"}, status=503)
 
     async def do_react():
         try:
-            channel = client.get_channel(int(channel_id))
-            if not channel:
-                channel = await client.fetch_channel(int(channel_id))
-            msg = await channel.fetch_message(int(message_id))
+            channel = await discord_resolver.channel(channel_id)
+            msg = channel and await discord_resolver.message(channel, message_id)
+            if msg is None:
+                return {"error": "Mensaje no encontrado"}
             await msg.add_reaction(emoji)
             return {"success": True}
         except discord.NotFound:
@@ -1222,15 +4273,25 @@ def react_message():
             return {"error": str(e)}
 
     try:
-        future = asyncio.run_coroutine_threadsafe(do_react(), client.loop)
-        return jsonify(future.result(timeout=10))
+        return web.json_response(await _await_bot(do_react(), timeout=10))
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return web.json_response({"error": str(e)}, status=500)
+
 
+async def start_web_server():
+    global web_runner
+    app.add_routes(routes)
+    app.router.add_static("/static", STATIC_DIR)
+    web_runner = web.AppRunner(app, access_log=None)
+    await web_runner.setup()
+    await web.TCPSite(web_runner, WEB_HOST, WEB_PORT).start()
+    log_index.warm()
+    logger.info(f">>> [WEB] Dashboard en http://{WEB_HOST}:{WEB_PORT}")
 
-def run_flask():
-    app.run(host="0.0.0.0", port=5000, debug=False, use_reloader=False)
+async def stop_web_server():
+    if web_runner is not None:
+        await web_runner.cleanup()
 
 if __name__ == "__main__":
-    threading.Thread(target=run_flask, daemon=True).start()
-    client.run(TOKEN)
\ No newline at end of file
+    # log_handler=None: discord.py usa el logging ya configurado arriba
+    client.run(TOKEN, log_handler=None)
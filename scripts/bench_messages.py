@@ -0,0 +1,82 @@
+# Benchmark de las consultas de polling de /api/messages y /api/channels antes y después
+# de las migraciones (índice channel_id/message_id + tabla channels).
+# Uso: python scripts/bench_messages.py [filas] [canales]
+import os, sys, time, random, tempfile, statistics
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+CHANNELS = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+ITERATIONS = 50
+
+tmp = tempfile.mkdtemp(prefix="blz-bench-")
+os.environ["DATABASE_PATH"] = os.path.join(tmp, "bench.db")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import bot  # noqa: E402
+
+# Consultas tal y como estaban antes de las migraciones (ordenadas por timestamp, DISTINCT)
+BEFORE = {
+    "poll": "SELECT * FROM messages WHERE channel_id=? AND message_id > ? ORDER BY timestamp ASC",
+    "initial": "SELECT * FROM (SELECT * FROM messages WHERE channel_id=? ORDER BY timestamp DESC LIMIT 100) ORDER BY timestamp ASC",
+    "channels": "SELECT DISTINCT channel_name as name, channel_id as id FROM messages",
+}
+# Consultas actuales de get_messages/get_channels
+AFTER = {
+    "poll": "SELECT * FROM messages WHERE channel_id=? AND message_id > ? ORDER BY message_id ASC",
+    "initial": "SELECT * FROM (SELECT * FROM messages WHERE channel_id=? ORDER BY message_id DESC LIMIT 100) ORDER BY message_id ASC",
+    "channels": "SELECT channel_name as name, channel_id as id FROM channels",
+}
+
+def reset_to_v1():
+    # Al importar bot ya se migró la BD vacía: volver al esquema v1 (sin índice ni tabla channels)
+    with bot.db_pool.connection() as conn:
+        conn.execute("DROP TRIGGER IF EXISTS trg_messages_insert_channels")
+        conn.execute("DROP TRIGGER IF EXISTS trg_messages_delete_channels")
+        conn.execute("DROP TABLE IF EXISTS channels")
+        conn.execute("DROP INDEX IF EXISTS idx_messages_channel_msg")
+        conn.execute("PRAGMA user_version=1")
+
+def fill():
+    base_id = 1_200_000_000_000_000_000
+    batch = []
+    with bot.db_pool.connection() as conn:
+        for i in range(ROWS):
+            cid = 1000 + (i % CHANNELS)
+            batch.append((cid, f"ticket-{cid}", "user", "", f"mensaje {i}", 42, base_id + i,
+                          "2026-01-01T00:00:00", None, None))
+            if len(batch) == 50_000:
+                conn.executemany(bot._MESSAGE_INSERT_SQL, batch)
+                batch.clear()
+        if batch:
+            conn.executemany(bot._MESSAGE_INSERT_SQL, batch)
+    return base_id + ROWS - 1
+
+def timed(sql, params_fn):
+    samples = []
+    with bot.db_pool.connection() as conn:
+        for _ in range(ITERATIONS):
+            t0 = time.perf_counter()
+            conn.execute(sql, params_fn()).fetchall()
+            samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+def run(label, last_id, queries):
+    # El caso típico del polling: el cliente ya tiene el último mensaje y no hay nada nuevo
+    channel = lambda: 1000 + random.randrange(CHANNELS)
+    results = {
+        "poll since_id": timed(queries["poll"], lambda: (channel(), last_id)),
+        "initial limit=100": timed(queries["initial"], lambda: (channel(),)),
+        "channels list": timed(queries["channels"], lambda: ()),
+    }
+    for name, (p50, p95) in results.items():
+        print(f"{label:<8} {name:<20} p50={p50:9.3f} ms  p95={p95:9.3f} ms")
+
+if __name__ == "__main__":
+    reset_to_v1()
+    t0 = time.perf_counter()
+    last_id = fill()
+    print(f"{ROWS} filas en {CHANNELS} canales ({time.perf_counter() - t0:.1f}s de carga)")
+    run("antes", last_id, BEFORE)
+    t0 = time.perf_counter()
+    version = bot.migrate_db()
+    print(f"migración a v{version}: {time.perf_counter() - t0:.1f}s")
+    run("después", last_id, AFTER)
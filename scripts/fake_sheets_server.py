@@ -0,0 +1,103 @@
+# Servidor local que imita values:batchGet / values:batchUpdate de la API de Sheets.
+# Para probar el tracker de EP sin Google:
+#   python scripts/fake_sheets_server.py --port 8089 --fail 2
+#   SHEETS_API_BASE=http://127.0.0.1:8089/v4 + SheetsTransport(token_provider=lambda: "test")
+# --fail N responde 503 a las N primeras peticiones (para ver los reintentos).
+import argparse, re
+from aiohttp import web
+
+RANGE_RE = re.compile(r"^(?:'[^']*'!|[^!]*!)?([A-Z]+)(\d+)?(?::([A-Z]+)(\d+)?)?$")
+
+
+def col_number(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + (ord(ch) - 64)
+    return n
+
+
+def col_letters(n):
+    s = ""
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+class FakeSheet:
+    def __init__(self, fail_first=0):
+        self.cells = {}  # (columna, fila) -> valor
+        self.fail_left = fail_first
+        self.calls = []
+
+    def _bounds(self, range_):
+        m = RANGE_RE.match(range_)
+        if not m:
+            raise web.HTTPBadRequest(text=f"bad range {range_}")
+        c1, r1, c2, r2 = m.groups()
+        c1 = col_number(c1)
+        c2 = col_number(c2) if c2 else c1
+        r1 = int(r1) if r1 else 1
+        max_row = max([r for (_, r) in self.cells] + [r1])
+        r2 = int(r2) if r2 else (r1 if not m.group(3) else max_row)
+        return c1, r1, c2, r2
+
+    def read(self, range_):
+        c1, r1, c2, r2 = self._bounds(range_)
+        rows = []
+        for r in range(r1, r2 + 1):
+            row = [self.cells.get((c, r), "") for c in range(c1, c2 + 1)]
+            while row and row[-1] == "":
+                row.pop()
+            rows.append(row)
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def write(self, range_, values):
+        c1, r1, _, _ = self._bounds(range_)
+        for i, row in enumerate(values):
+            for j, value in enumerate(row):
+                self.cells[(c1 + j, r1 + i)] = str(value)
+
+    def maybe_fail(self):
+        if self.fail_left > 0:
+            self.fail_left -= 1
+            raise web.HTTPServiceUnavailable(text="fake outage")
+
+
+def make_app(sheet):
+    routes = web.RouteTableDef()
+
+    @routes.get("/v4/spreadsheets/{sheet_id}/values:batchGet")
+    async def batch_get(request):
+        sheet.calls.append(("batchGet", request.query.getall("ranges", [])))
+        sheet.maybe_fail()
+        ranges = request.query.getall("ranges", [])
+        return web.json_response({
+            "spreadsheetId": request.match_info["sheet_id"],
+            "valueRanges": [{"range": r, "majorDimension": "ROWS", "values": sheet.read(r)} for r in ranges]
+        })
+
+    @routes.post("/v4/spreadsheets/{sheet_id}/values:batchUpdate")
+    async def batch_update(request):
+        body = await request.json()
+        sheet.calls.append(("batchUpdate", [d["range"] for d in body.get("data", [])]))
+        sheet.maybe_fail()
+        for d in body.get("data", []):
+            sheet.write(d["range"], d["values"])
+        return web.json_response({"spreadsheetId": request.match_info["sheet_id"],
+                                  "totalUpdatedCells": sum(len(r) for d in body["data"] for r in d["values"])})
+
+    app = web.Application()
+    app.add_routes(routes)
+    app["sheet"] = sheet
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--fail", type=int, default=0)
+    args = parser.parse_args()
+    web.run_app(make_app(FakeSheet(args.fail)), host="127.0.0.1", port=args.port)
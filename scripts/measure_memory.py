@@ -0,0 +1,74 @@
+# Mide arranque (hasta on_ready) y RSS del bot en modo normal y en LOW_MEMORY_MODE.
+# Necesita DISCORD_TOKEN (y CATEGORY_ID) en el entorno o en .env; cada modo corre en su
+# propio proceso con una BD temporal y sin backfill de historial. Sin acceso al gateway
+# (token inválido, sin red) sólo se informa del import y del RSS antes de conectar.
+# Uso: python scripts/measure_memory.py [segundos tras on_ready]
+import os, sys, json, time, tempfile, subprocess
+
+SETTLE = float(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1] != "--child" else 30.0
+MODES = {"normal": {"LOW_MEMORY_MODE": "0"}, "low-memory": {"LOW_MEMORY_MODE": "1"}}
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # pico, no actual
+
+def child():
+    t0 = time.perf_counter()
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+    import bot
+    result = {"import_s": round(time.perf_counter() - t0, 2), "rss_import_mb": round(rss_mb(), 1)}
+    print("PARTIAL " + json.dumps(result), flush=True)
+
+    async def on_ready_measure():
+        result["ready_s"] = round(time.perf_counter() - t0, 2)
+        result["rss_ready_mb"] = round(rss_mb(), 1)
+        await bot.asyncio.sleep(SETTLE)
+        result["rss_settled_mb"] = round(rss_mb(), 1)
+        result["cached_members"] = sum(len(g.members) for g in bot.client.guilds)
+        result["guild_member_count"] = sum(g.member_count or 0 for g in bot.client.guilds)
+        print("RESULT " + json.dumps(result), flush=True)
+        await bot.client.close()
+
+    bot.client.add_listener(on_ready_measure, "on_ready")
+    bot.client.run(bot.TOKEN, log_handler=None)
+
+def main():
+    rows = {}
+    for name, env in MODES.items():
+        tmp = tempfile.mkdtemp(prefix="blz-mem-")
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", str(SETTLE)],
+            env={**os.environ, **env, "DATABASE_PATH": os.path.join(tmp, "mem.db"), "HISTORY_LIMIT": "0", "PORT": "0"},
+            capture_output=True, text=True, timeout=SETTLE + 300
+        )
+        lines = proc.stdout.splitlines()
+        line = next((l for l in lines if l.startswith("RESULT ")), None)
+        if line is None:
+            partial = next((l for l in lines if l.startswith("PARTIAL ")), None)
+            error = (proc.stderr.strip().splitlines() or ["?"])[-1]
+            print(f"{name}: sin on_ready (exit {proc.returncode}): {error}")
+            if partial is None:
+                continue
+            line = partial
+        rows[name] = json.loads(line.split(" ", 1)[1])
+    for name, r in rows.items():
+        row = f"{name:<11} import={r['import_s']:5.2f}s  RSS import={r['rss_import_mb']:7.1f} MB"
+        if "ready_s" in r:
+            row += (f"  on_ready={r['ready_s']:6.2f}s  RSS ready={r['rss_ready_mb']:7.1f} MB  "
+                    f"RSS +{SETTLE:.0f}s={r['rss_settled_mb']:7.1f} MB  "
+                    f"miembros en caché={r['cached_members']}/{r['guild_member_count']}")
+        print(row)
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        SETTLE = float(sys.argv[-1])
+        child()
+    else:
+        main()
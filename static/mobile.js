@@ -27,6 +27,11 @@
         timerInterval: null,
         lastRank: null,
         pollInterval: null,
+        liveStream: null,
+        liveStreamOk: false,
+        // Keyset cursor (before_id) for the next page of history; null = start reached
+        olderCursor: {},
+        loadingOlder: false,
         // For the message grouping (consecutive from same author)
         lastAuthorId: null
     };
@@ -189,13 +194,15 @@
         return embeds.map(renderEmbed).join('');
     }
 
-    function appendMessage(msg, isFresh) {
+    const PAGE_SIZE = 100;
+
+    function appendMessage(msg, isFresh, anchor) {
         if (feed.querySelector('[data-msg-id="' + CSS.escape(String(msg.message_id)) + '"]')) return;
 
         const isMe = !!(state.botId && msg.author_id && String(msg.author_id) === String(state.botId));
         const authorId = String(msg.author_id || msg.author_name || '?');
         // Group messages when the previous one in feed is from the same author within 3 minutes
-        const prev = feed.lastElementChild;
+        const prev = anchor ? anchor.previousElementSibling : feed.lastElementChild;
         let grouped = false;
         if (prev && prev.classList && prev.classList.contains('m-msg')) {
             const prevAuthor = prev.dataset.authorKey;
@@ -222,7 +229,7 @@
             '<div class="m-msg-content">' + renderContent(msg.content || '') + '</div>' +
             renderEmbeds(msg.embeds);
 
-        feed.appendChild(el);
+        feed.insertBefore(el, anchor || null);
     }
 
     async function resolveMentions(msgs) {
@@ -258,16 +265,25 @@
             if (!initial) {
                 url += '&since_id=' + encodeURIComponent(state.lastMessageId[state.currentChannelId] || '0');
             } else {
-                url += '&limit=200';
+                url += '&limit=' + PAGE_SIZE;
             }
+            url += '&mentions=1';  // server resolves <@id>/<@&id> in the same response
             const res = await fetch(url);
-            const msgs = await res.json();
+            const body = await res.json();
+            const msgs = Array.isArray(body) ? body : body.messages;
             if (!Array.isArray(msgs)) return;
+            if (body.mentions) {
+                Object.assign(state.mentionCache.users, body.mentions.users || {});
+                Object.assign(state.mentionCache.roles, body.mentions.roles || {});
+            }
             await resolveMentions(msgs);
 
             const wasNearBottom = (feed.scrollHeight - feed.scrollTop - feed.clientHeight) < 120;
 
             if (initial) {
+                state.olderCursor[state.currentChannelId] = Array.isArray(body)
+                    ? (msgs.length >= PAGE_SIZE ? String(msgs[0].message_id) : null)
+                    : (body.next_cursor || null);
                 feed.innerHTML = '';
                 if (!msgs.length) {
                     feed.innerHTML =
@@ -304,6 +320,81 @@
         }
     }
 
+    // Keyset page before the oldest loaded message; same cost at page 1 as at page 500
+    async function fetchOlderMessages() {
+        const channelId = state.currentChannelId;
+        const cursor = channelId && state.olderCursor[channelId];
+        if (!cursor || state.loadingOlder) return;
+        state.loadingOlder = true;
+        try {
+            const res = await fetch('/api/messages?channel_id=' + encodeURIComponent(channelId) +
+                '&before_id=' + encodeURIComponent(cursor) + '&limit=' + PAGE_SIZE + '&mentions=1');
+            const body = await res.json();
+            if (!res.ok || channelId !== state.currentChannelId) return;
+            const msgs = body.messages || [];
+            if (body.mentions) {
+                Object.assign(state.mentionCache.users, body.mentions.users || {});
+                Object.assign(state.mentionCache.roles, body.mentions.roles || {});
+            }
+            await resolveMentions(msgs);
+            if (channelId !== state.currentChannelId) return;
+            // Keep the viewport on the same message while the page is prepended
+            const anchor = feed.firstChild;
+            const prevHeight = feed.scrollHeight;
+            msgs.forEach(m => appendMessage(m, false, anchor));
+            feed.scrollTop += feed.scrollHeight - prevHeight;
+            state.olderCursor[channelId] = body.next_cursor || null;
+        } catch (e) {
+            console.warn('fetchOlderMessages error', e);
+        } finally {
+            state.loadingOlder = false;
+        }
+    }
+
+    // ─── LIVE STREAM (SSE) ───────────────────────────────────────────────
+    function openLiveStream(channelId) {
+        if (state.liveStream) state.liveStream.close();
+        state.liveStream = null;
+        state.liveStreamOk = false;
+        if (typeof EventSource === 'undefined') return;
+        const es = new EventSource('/api/stream?channel_id=' + encodeURIComponent(channelId));
+        state.liveStream = es;
+        es.onopen  = () => { state.liveStreamOk = true; fetchMessages(false); };
+        es.onerror = () => { state.liveStreamOk = false; };
+        es.addEventListener('message', e => onLiveMessage(JSON.parse(e.data)));
+        es.addEventListener('edit', e => {
+            const d  = JSON.parse(e.data);
+            const el = feed.querySelector('[data-msg-id="' + CSS.escape(String(d.message_id)) + '"]');
+            if (!el) return;
+            if (d.content !== undefined) {
+                const cd = el.querySelector('.m-msg-content');
+                if (cd) cd.innerHTML = renderContent(d.content);
+            }
+            if (d.embeds) {
+                el.querySelectorAll('.m-msg-embed').forEach(n => n.remove());
+                el.querySelector('.m-msg-content')?.insertAdjacentHTML('afterend', renderEmbeds(d.embeds));
+            }
+        });
+        es.addEventListener('delete', e => {
+            const d = JSON.parse(e.data);
+            feed.querySelector('[data-msg-id="' + CSS.escape(String(d.message_id)) + '"]')?.remove();
+        });
+        es.addEventListener('resync', () => fetchMessages(false));
+    }
+
+    async function onLiveMessage(msg) {
+        if (String(msg.channel_id) !== String(state.currentChannelId)) return;
+        if (state.isFetching) { setTimeout(() => onLiveMessage(msg), 250); return; }
+        await resolveMentions([msg]);
+        const wasNearBottom = (feed.scrollHeight - feed.scrollTop - feed.clientHeight) < 120;
+        appendMessage(msg, true);
+        if (wasNearBottom) feed.scrollTop = feed.scrollHeight;
+        try {
+            if (BigInt(String(msg.message_id)) > BigInt(state.lastMessageId[state.currentChannelId] || '0'))
+                state.lastMessageId[state.currentChannelId] = String(msg.message_id);
+        } catch (_) {}
+    }
+
     // ─── CHANNELS ────────────────────────────────────────────────────────
     async function fetchChannels() {
         try {
@@ -343,6 +434,7 @@
                 '<div class="m-feed-empty-title">Loading…</div>' +
             '</div>';
         fetchMessages(true);
+        openLiveStream(id);
         closeChannels();
         resetTimer();
     }
@@ -631,11 +723,16 @@
         await fetchChannels();
         resetTimer();
 
-        // Poll for new messages — 1.2s is plenty for mobile, saves battery
+        // Poll for new messages only while the live stream is down — 1.2s is plenty for mobile
         state.pollInterval = setInterval(() => {
-            if (!state.isFetching && state.currentChannelId) fetchMessages(false);
+            if (!state.isFetching && state.currentChannelId && !state.liveStreamOk) fetchMessages(false);
         }, 1200);
 
+        // Infinite scroll: next page of history when nearing the top
+        feed.addEventListener('scroll', () => {
+            if (feed.scrollTop < 200) fetchOlderMessages();
+        }, { passive: true });
+
         // Refetch channels and bot info periodically
         setInterval(fetchChannels, 60000);
 
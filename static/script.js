@@ -25,8 +25,13 @@
     let channelMap    = {};
     let mentionCache  = { users: {}, roles: {} };
     let lastMessageId = {};
+    let olderCursor   = {};  // channel -> before_id for the next page of history (null = start reached)
+    let loadingOlder  = false;
+    const PAGE_SIZE   = 100;
     let timerInterval = null;
-    let acMembers = [], acRoles = [], acLoaded = false, acLoadedAt = 0;
+    let liveStream = null, liveStreamOk = false;
+    const acCache = new Map();  // query -> { at, members, roles }
+    let acSeq = 0;
     const AC_CACHE_MS = 180000;
     let acBox = null, acItems = [], acIdx = -1, acTriggerPos = -1;
 
@@ -38,8 +43,9 @@
         startTimer();
         setupEventListeners();
         initSettings();
+        // Polling only as a fallback while the live stream is down
         setInterval(() => {
-            if (!isFetching && currentChannelId) fetchMessages(false);
+            if (!isFetching && currentChannelId && !liveStreamOk) fetchMessages(false);
         }, 500);
         document.getElementById('copy-stats-btn')?.addEventListener('click', function () {
             if (!canvas) { showToast('No stats generated yet', 'warn'); return; }
@@ -126,6 +132,10 @@
             msgInput.addEventListener('keydown',  handleAcKeydown);
         }
         if (sendBtn) sendBtn.onclick = sendMessage;
+        // Infinite scroll: next page of history when nearing the top
+        chatFeed?.addEventListener('scroll', () => {
+            if (chatFeed.scrollTop < 200) fetchOlderMessages();
+        }, { passive: true });
         document.addEventListener('keydown', e => {
             if (e.key === 'Escape') closeAllModals();
             if (e.code === 'Digit0' && e.getModifierState('AltGraph')) { e.preventDefault(); openLogs(); }
@@ -179,6 +189,7 @@
             resetTimer();
             chatFeed.innerHTML = '<div class="feed-empty"><div class="feed-empty-icon">⚡</div><p class="feed-empty-title">Receiving signal...</p><p class="feed-empty-sub">信号受信中</p></div>';
             fetchMessages(true);
+            openLiveStream(id);
             if (forDrawer) document.getElementById('channel-drawer')?.classList.remove('open');
         };
         return div;
@@ -216,12 +227,21 @@
             if (!initial) {
                 url += '&since_id=' + encodeURIComponent(lastMessageId[currentChannelId] || '0');
             } else {
-                url += '&limit=1000';
+                url += '&limit=' + PAGE_SIZE;
             }
+            url += '&mentions=1';  // server resolves <@id>/<@&id> in the same response
             const res  = await fetch(url);
-            const msgs = await res.json();
+            const body = await res.json();
+            const msgs = Array.isArray(body) ? body : (body.messages || []);
+            if (body.mentions) {
+                Object.assign(mentionCache.users, body.mentions.users || {});
+                Object.assign(mentionCache.roles, body.mentions.roles || {});
+            }
             await resolveMentions(msgs);
             if (initial) {
+                olderCursor[currentChannelId] = Array.isArray(body)
+                    ? (msgs.length >= PAGE_SIZE ? String(msgs[0].message_id) : null)
+                    : (body.next_cursor || null);
                 chatFeed.innerHTML = '';
                 if (!msgs.length) {
                     chatFeed.innerHTML = '<div class="feed-empty"><div class="feed-empty-icon">無</div><p class="feed-empty-title">No messages yet</p><p class="feed-empty-sub">信号なし</p></div>';
@@ -244,6 +264,77 @@
         finally { isFetching = false; }
     }
 
+    // Keyset page before the oldest loaded message; same cost at page 1 as at page 500
+    async function fetchOlderMessages() {
+        const channelId = currentChannelId;
+        const cursor = channelId && olderCursor[channelId];
+        if (!cursor || loadingOlder) return;
+        loadingOlder = true;
+        try {
+            const res  = await fetch('/api/messages?channel_id=' + encodeURIComponent(channelId) +
+                '&before_id=' + encodeURIComponent(cursor) + '&limit=' + PAGE_SIZE + '&mentions=1');
+            const body = await res.json();
+            if (!res.ok || channelId !== currentChannelId) return;
+            const msgs = body.messages || [];
+            if (body.mentions) {
+                Object.assign(mentionCache.users, body.mentions.users || {});
+                Object.assign(mentionCache.roles, body.mentions.roles || {});
+            }
+            await resolveMentions(msgs);
+            if (channelId !== currentChannelId) return;
+            // Keep the viewport on the same message while the page is prepended
+            const anchor = chatFeed.firstChild;
+            const prevHeight = chatFeed.scrollHeight;
+            msgs.forEach(msg => appendMessage(msg, false, anchor));
+            chatFeed.scrollTop += chatFeed.scrollHeight - prevHeight;
+            olderCursor[channelId] = body.next_cursor || null;
+        } catch (e) { console.error('fetchOlderMessages error', e); }
+        finally { loadingOlder = false; }
+    }
+
+    // ─── LIVE STREAM (SSE) ────────────────────────────────────────────────────
+    function openLiveStream(channelId) {
+        if (liveStream) liveStream.close();
+        liveStream = null; liveStreamOk = false;
+        if (typeof EventSource === 'undefined') return;
+        const es = new EventSource('/api/stream?channel_id=' + encodeURIComponent(channelId));
+        liveStream = es;
+        es.onopen  = () => { liveStreamOk = true; if (!isFetching) fetchMessages(false); };
+        es.onerror = () => { liveStreamOk = false; };  // EventSource reconnects on its own; polling covers the gap
+        es.addEventListener('message', e => onLiveMessage(JSON.parse(e.data)));
+        es.addEventListener('edit', e => {
+            const d  = JSON.parse(e.data);
+            const el = chatFeed.querySelector('[data-msg-id="' + d.message_id + '"]');
+            if (!el) return;
+            if (d.content !== undefined) {
+                const cd = el.querySelector('.msg-content');
+                if (cd) cd.innerHTML = renderDiscordContent(d.content);
+                el.dataset.rawContent = d.content;
+            }
+            if (d.embeds) {
+                el.querySelectorAll('.msg-embed').forEach(n => n.remove());
+                el.querySelector('.msg-content')?.insertAdjacentHTML('afterend', renderEmbeds(d.embeds));
+            }
+        });
+        es.addEventListener('delete', e => {
+            const d = JSON.parse(e.data);
+            chatFeed.querySelector('[data-msg-id="' + d.message_id + '"]')?.remove();
+        });
+        es.addEventListener('resync', () => { if (!isFetching) fetchMessages(false); });
+    }
+
+    async function onLiveMessage(msg) {
+        if (String(msg.channel_id) !== String(currentChannelId)) return;
+        // Don't race the initial load (it clears the feed); retry once it's done
+        if (isFetching) { setTimeout(() => onLiveMessage(msg), 250); return; }
+        await resolveMentions([msg]);
+        appendMessage(msg, true);
+        chatFeed.scrollTop = chatFeed.scrollHeight;
+        const prev = lastMessageId[currentChannelId] || '0';
+        if (BigInt(String(msg.message_id)) > BigInt(prev))
+            lastMessageId[currentChannelId] = String(msg.message_id);
+    }
+
     // ─── MENTION RESOLUTION ───────────────────────────────────────────────────
     async function resolveMentions(msgs) {
         const userIds = new Set(), roleIds = new Set();
@@ -416,7 +507,7 @@
     }
 
     // ─── APPEND MESSAGE ───────────────────────────────────────────────────────
-    function appendMessage(msg, isNew) {
+    function appendMessage(msg, isNew, anchor) {
         if (chatFeed.querySelector('[data-msg-id="' + msg.message_id + '"]')) return;
         const el = document.createElement('div');
         el.className = 'message';
@@ -438,7 +529,7 @@
             renderEmbeds(msg.embeds);
 
         decorateMessage(el);
-        chatFeed.appendChild(el);
+        chatFeed.insertBefore(el, anchor || null);
 
         if (isNew) {
             requestAnimationFrame(() => {
@@ -673,9 +764,11 @@
         const query = val.slice(atPos + 1, caret).toLowerCase();
         if (query.includes(' ')) { hideAc(); return; }
         acTriggerPos = atPos;
-        await ensureAcData();
-        const roleMatches = acRoles.filter(r => !query || r.name.toLowerCase().includes(query)).slice(0, query ? 4 : 3).map(r => ({ ...r, type: 'role' }));
-        const memberMatches = acMembers.filter(m => !query || m.display.toLowerCase().includes(query) || m.username.toLowerCase().includes(query)).slice(0, 10 - roleMatches.length).map(m => ({ ...m, type: 'user' }));
+        const seq = ++acSeq;
+        const data = await queryAc(query);
+        if (seq !== acSeq || !data) return;  // a newer keystroke already answered
+        const roleMatches = data.roles.slice(0, query ? 4 : 3).map(r => ({ ...r, type: 'role' }));
+        const memberMatches = data.members.slice(0, 10 - roleMatches.length).map(m => ({ ...m, type: 'user' }));
         const matches = [...roleMatches, ...memberMatches];
         if (!matches.length) { hideAc(); return; }
         renderAc(matches);
@@ -731,17 +824,19 @@
         msgInput.setSelectionRange(newPos, newPos);
         hideAc(); msgInput.focus();
     }
-    async function ensureAcData(forceRefresh) {
-        const now = Date.now();
-        if (acLoaded && !forceRefresh && (now - acLoadedAt) < AC_CACHE_MS) return;
+    // Prefix search runs server-side (/api/members?q=); answers are cached briefly per query
+    async function queryAc(query) {
+        const now = Date.now(), hit = acCache.get(query);
+        if (hit && (now - hit.at) < AC_CACHE_MS) return hit;
         try {
-            const r = await fetch('/api/members');
-            if (r.ok) {
-                const j = await r.json();
-                acMembers = j.members || []; acRoles = j.roles || [];
-                acLoaded = true; acLoadedAt = now;
-            }
-        } catch (e) { console.warn('ensureAcData error', e); }
+            const r = await fetch('/api/members?q=' + encodeURIComponent(query) + '&limit=10&role_limit=4');
+            if (!r.ok) return null;
+            const j = await r.json();
+            const entry = { at: now, members: j.members || [], roles: j.roles || [] };
+            if (acCache.size > 200) acCache.clear();
+            acCache.set(query, entry);
+            return entry;
+        } catch (e) { console.warn('queryAc error', e); return null; }
     }
 
     // ─── SEND MESSAGE ─────────────────────────────────────────────────────────
@@ -803,7 +898,9 @@
     };
 
     // ─── LOGS PANEL ───────────────────────────────────────────────────────────
+    // Live via /api/logs/stream; if the stream drops, poll /api/logs?after=<offset> for new bytes only
     let logsInterval = null, logsUnlocked = false;
+    let logsStream = null, logsStreamOk = false, logsCursor = null, logsShownLines = 0, logsBuffer = [];
     function openLogs() {
         const panel = document.getElementById('logs-panel');
         if (!panel) return;
@@ -814,11 +911,16 @@
             document.getElementById('logs-user').value = '';
             document.getElementById('logs-pass').value = '';
             document.getElementById('logs-error').textContent = '';
-        } else { fetchLogs(); }
+        } else { startLogsLive(); }
     }
     window.openLogs  = openLogs;
     window.fetchLogs = fetchLogs;
-    window.closeLogs = function () { document.getElementById('logs-panel')?.classList.remove('active'); clearInterval(logsInterval); };
+    window.closeLogs = function () {
+        document.getElementById('logs-panel')?.classList.remove('active');
+        clearInterval(logsInterval);
+        if (logsStream) logsStream.close();
+        logsStream = null; logsStreamOk = false;
+    };
     window.authLogs  = function () {
         const user = document.getElementById('logs-user').value;
         const pass = document.getElementById('logs-pass').value;
@@ -826,26 +928,64 @@
             logsUnlocked = true;
             document.getElementById('logs-auth').style.display   = 'none';
             document.getElementById('logs-viewer').style.display = 'block';
-            fetchLogs();
-            clearInterval(logsInterval);
-            logsInterval = setInterval(() => { if (document.getElementById('logs-panel')?.classList.contains('active')) fetchLogs(); else clearInterval(logsInterval); }, 3000);
+            startLogsLive();
         } else { document.getElementById('logs-error').textContent = '❌ Incorrect credentials'; }
     };
+    function logsLines() { return parseInt(document.getElementById('logs-lines-input')?.value) || 200; }
+    function startLogsLive() {
+        fetchLogs();
+        openLogsStream();
+        clearInterval(logsInterval);
+        logsInterval = setInterval(() => {
+            if (!document.getElementById('logs-panel')?.classList.contains('active')) { clearInterval(logsInterval); return; }
+            if (!logsStreamOk) fetchLogs();
+        }, 3000);
+    }
+    function openLogsStream() {
+        if (logsStream) logsStream.close();
+        logsStream = null; logsStreamOk = false;
+        if (typeof EventSource === 'undefined') return;
+        const es = new EventSource('/api/logs/stream?lines=' + logsLines());
+        logsStream = es;
+        es.onopen  = () => { logsStreamOk = true; };
+        es.onerror = () => { logsStreamOk = false; };
+        es.addEventListener('log', e => {
+            const d = JSON.parse(e.data);
+            const [inode, offset] = (e.lastEventId || '').split(':');
+            if (offset !== undefined) logsCursor = { inode, offset };
+            renderLogs(d.text, d.reset);
+        });
+    }
     async function fetchLogs() {
         try {
-            const lines = parseInt(document.getElementById('logs-lines-input')?.value) || 200;
-            const text  = await (await fetch('/api/logs?lines=' + lines)).text();
-            const pre   = document.getElementById('logs-content');
-            const scrollBox = document.getElementById('logs-scroll');
-            if (!pre) return;
-            // Only auto-scroll if user was already near the bottom
-            const nearBottom = scrollBox
-                ? (scrollBox.scrollHeight - scrollBox.scrollTop - scrollBox.clientHeight) < 80
-                : true;
-            pre.innerHTML = colorizeLogs(escapeHtml(text));
-            if (scrollBox && nearBottom) scrollBox.scrollTop = scrollBox.scrollHeight;
+            const lines = logsLines();
+            // Changing the line count needs a fresh tail; otherwise only what was appended since the cursor
+            const url = (logsCursor && lines === logsShownLines)
+                ? '/api/logs?after=' + logsCursor.offset + '&inode=' + logsCursor.inode + '&lines=' + lines
+                : '/api/logs?lines=' + lines;
+            const r    = await fetch(url);
+            const text = await r.text();
+            if (!r.ok) throw new Error(text);
+            logsCursor = { offset: r.headers.get('X-Log-Offset'), inode: r.headers.get('X-Log-Inode') };
+            renderLogs(text, r.headers.get('X-Log-Reset') !== '0');
         } catch (e) { const pre = document.getElementById('logs-content'); if (pre) pre.textContent = 'Error loading logs: ' + e.message; }
     }
+    function renderLogs(text, reset) {
+        const pre   = document.getElementById('logs-content');
+        const scrollBox = document.getElementById('logs-scroll');
+        if (!pre) return;
+        const lines = logsLines();
+        if (reset) { logsBuffer = []; logsShownLines = lines; }
+        else if (!text) return;
+        if (text) logsBuffer.push(...text.replace(/\n$/, '').split('\n'));
+        if (logsBuffer.length > lines) logsBuffer = logsBuffer.slice(-lines);
+        // Only auto-scroll if user was already near the bottom
+        const nearBottom = scrollBox
+            ? (scrollBox.scrollHeight - scrollBox.scrollTop - scrollBox.clientHeight) < 80
+            : true;
+        pre.innerHTML = colorizeLogs(escapeHtml(logsBuffer.join('\n')));
+        if (scrollBox && nearBottom) scrollBox.scrollTop = scrollBox.scrollHeight;
+    }
     function colorizeLogs(t) {
         return t.split('\n').map(line => {
             if (line.includes('[ERROR]') || line.includes('!!!'))       return '<span style="color:#ff6b6b">' + line + '</span>';